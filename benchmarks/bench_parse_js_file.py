@@ -0,0 +1,69 @@
+"""
+Compare the vectorized `parse_js_file` against the original per-vertex loop.
+
+Run from the repository root:
+    python -m benchmarks.bench_parse_js_file data/hre/digital_atlas/geotiles/TILES_1 1
+"""
+import os
+import re
+import sys
+import time
+
+from shapely.geometry import Polygon
+
+from src.get_data.fun_get_data import AREA_PATTERN, parse_js_file, px2rw_point_with_offset
+
+
+def parse_js_file_loop(filepath, row, col, zoomLevel):
+    """The original implementation: one Python call per vertex, one Polygon at a time."""
+    polygons = []
+    with open(filepath, "r", encoding="utf-8") as f:
+        content = f.read()
+        matches = re.findall(AREA_PATTERN, content)
+        for coords_str, region_id, _, region_name in matches:
+            coord_list = list(map(int, coords_str.split(",")))
+            points_utm = []
+            for i in range(0, len(coord_list), 2):
+                points_utm.append(px2rw_point_with_offset((coord_list[i], coord_list[i + 1]), row, col, zoomLevel))
+            if len(points_utm) >= 3:
+                polygons.append({
+                    "geometry": Polygon(points_utm),
+                    "region_id": int(region_id),
+                    "region_name": region_name
+                })
+    return polygons
+
+
+def best_of(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(tiles_dir, zoomLevel):
+    total_loop = total_vec = 0.0
+    print(f"{'tile':>8} {'polygons':>9} {'loop ms':>9} {'vector ms':>10} {'speedup':>8}")
+    for filename in sorted(os.listdir(tiles_dir)):
+        if not filename.endswith(".JS"):
+            continue
+        row, col = map(int, filename.replace(".JS", "").split("_"))
+        path = os.path.join(tiles_dir, filename)
+        t_loop, expected = best_of(parse_js_file_loop, path, row, col, zoomLevel)
+        t_vec, actual = best_of(parse_js_file, path, row, col, zoomLevel)
+        assert len(expected) == len(actual), filename
+        for e, a in zip(expected, actual):
+            assert e["geometry"].wkb == a["geometry"].wkb, filename
+            assert (e["region_id"], e["region_name"]) == (a["region_id"], a["region_name"]), filename
+        total_loop += t_loop
+        total_vec += t_vec
+        print(f"{filename[:-3]:>8} {len(actual):>9} {t_loop * 1e3:>9.2f} {t_vec * 1e3:>10.2f} "
+              f"{t_loop / max(t_vec, 1e-9):>7.1f}x")
+    print(f"✅ Identical output. Total: {total_loop:.3f}s loop vs {total_vec:.3f}s vectorized "
+          f"({total_loop / max(total_vec, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]))
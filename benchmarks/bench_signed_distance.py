@@ -0,0 +1,54 @@
+"""
+Time the row-wise signed-distance computation from data_manage.py against the
+STRtree-based `signed_distance_to_border` on the full VG250 municipality set, and
+check that both give exactly the same numbers.
+
+Run from the repository root:
+    python -m benchmarks.bench_signed_distance \
+        data/shapefiles/vg250_ebenen_1231/DE_VG250.gpkg data/hre/digital_atlas/maptiles/WHRE.shp
+"""
+import sys
+import time
+
+import numpy as np
+import geopandas as gpd
+
+from src.data_management.fun_distance import signed_distance_to_border
+
+west_germany_keys = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10']
+
+
+def signed_distance_apply(centroids, border, region):
+    """The original per-row computation."""
+    distance = centroids.apply(lambda pt: pt.distance(border))
+    signed = [d if region.contains(pt) else -d for pt, d in zip(centroids, distance)]
+    return distance.to_numpy(), np.asarray(signed)
+
+
+def main(geo_filepath, hre_filepath):
+    gem_data = gpd.read_file(geo_filepath, layer='vg250_gem')
+    west = gem_data[gem_data["SN_L"].isin(west_germany_keys)]
+    hre_union = gpd.read_file(hre_filepath).to_crs(west.crs).union_all()
+    boundary = west.geometry.union_all()
+    border = hre_union.boundary.intersection(boundary)
+    region = hre_union.intersection(boundary)
+    centroids = west.geometry.centroid
+
+    start = time.perf_counter()
+    expected_distance, expected_signed = signed_distance_apply(centroids, border, region)
+    t_apply = time.perf_counter() - start
+
+    start = time.perf_counter()
+    distance, signed = signed_distance_to_border(centroids.values, border, region)
+    t_tree = time.perf_counter() - start
+
+    assert np.array_equal(expected_distance, distance), "distances differ"
+    assert np.array_equal(expected_signed, signed), "signed distances differ"
+    print(f"{len(centroids)} municipalities")
+    print(f"apply:   {t_apply:.3f}s")
+    print(f"STRtree: {t_tree:.3f}s ({t_apply / max(t_tree, 1e-9):.1f}x faster)")
+    print("✅ Identical distances and signs")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
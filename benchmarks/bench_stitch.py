@@ -0,0 +1,60 @@
+"""
+Compare `stitch_tiles` against the buffer/round/dissolve chain it replaced in
+get_geo_data.py, on the real atlas tiles, and check that region areas match and that
+every stitched geometry is valid.
+
+Run from the repository root:
+    python -m benchmarks.bench_stitch data/hre/digital_atlas/geotiles/TILES_1 1
+"""
+import sys
+import time
+
+import numpy as np
+
+from src.get_data.fun_get_data import build_geodata, round_geometry
+from src.get_data.fun_stitch import stitch_tiles
+
+
+def cleanup_chain(gdf):
+    """The original cleanup steps from get_geo_data.py."""
+    gdf = gdf.copy()
+    gdf['geometry'] = gdf['geometry'].buffer(0)
+    gdf['geometry'] = gdf['geometry'].apply(round_geometry)
+    dissolved = gdf.dissolve(by="region_id")
+    dissolved['geometry'] = dissolved['geometry'].buffer(0.01).buffer(-0.01)
+    dissolved = dissolved.dissolve(by="region_id")
+    dissolved['geometry'] = dissolved['geometry'].simplify(tolerance=1.0, preserve_topology=True)
+    return dissolved.dissolve(by="region_id")
+
+
+def main(tiles_dir, zoomLevel, area_rtol=1e-4):
+    gdf = build_geodata(tiles_dir, zoomLevel)
+
+    start = time.perf_counter()
+    expected = cleanup_chain(gdf)
+    t_chain = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = stitch_tiles(gdf, zoomLevel)
+    t_stitch = time.perf_counter() - start
+
+    assert list(expected.index) == list(actual.index), "region ids differ"
+    area_expected = expected.area.to_numpy()
+    area_actual = actual.area.to_numpy()
+    rel_diff = np.abs(area_actual - area_expected) / np.maximum(area_expected, 1.0)
+    parts_expected = expected.geometry.count_geometries().sum()
+    parts_actual = actual.geometry.count_geometries().sum()
+
+    print(f"{len(gdf)} tile pieces -> {len(actual)} regions")
+    print(f"chain:  {t_chain:.3f}s, {parts_expected} polygon parts")
+    print(f"stitch: {t_stitch:.3f}s, {parts_actual} polygon parts ({t_chain / max(t_stitch, 1e-9):.1f}x faster)")
+    print(f"max relative area difference: {rel_diff.max():.2e} (region {actual.index[rel_diff.argmax()]})")
+    assert rel_diff.max() <= area_rtol, "region areas differ"
+    print("✅ Region areas match")
+    invalid = actual.index[~actual.geometry.is_valid.to_numpy()]
+    assert len(invalid) == 0, f"invalid geometries for regions {list(invalid)}"
+    print("✅ All stitched geometries are valid")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]))
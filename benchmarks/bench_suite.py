@@ -0,0 +1,234 @@
+"""
+Benchmark the pipeline's hot paths on synthetic inputs of configurable size (see
+`benchmarks/synthetic.py`) and flag time or memory regressions against stored
+baseline results.
+
+Cases: `parse_js_file` over every tile, `build_geodata`, `parse_attributes`, the
+geometry cleanup (`stitch_tiles`), `signed_distance_to_border`, the municipality /
+election / religion merge (`join_tables`) and a single-column map, raster and vector.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite                        # small size, compare with baseline.json
+    python -m benchmarks.bench_suite --sizes small medium --repeat 5
+    python -m benchmarks.bench_suite --save-baseline        # record the results as the new baseline
+
+Time is the best of `--repeat` runs; memory is the peak of Python allocations
+(tracemalloc) in one extra run, so GEOS and GDAL memory is not included. The exit
+code is 1 if any case is slower or bigger than the baseline beyond the tolerances.
+Baselines are only comparable on the same machine.
+"""
+import os
+import gc
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from benchmarks import synthetic
+from src.fun_join import join_tables
+from src.get_data.fun_get_data import build_geodata, list_tiles, parse_attributes, parse_js_file
+from src.get_data.fun_stitch import stitch_tiles
+from src.data_management.fun_distance import signed_distance_to_border
+from src.plot_maps.fun import plot_map_religion
+from src.plot_maps.fun_raster import LABEL_CACHE
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Input sizes: atlas regions, municipalities and election years
+SIZES = {
+    "small": {"regions": 400, "municipalities": 2000, "years": (2005, 2009)},
+    "medium": {"regions": 1600, "municipalities": 11000, "years": (1990, 1994, 1998, 2002, 2005, 2009)},
+    "large": {"regions": 6400, "municipalities": 40000, "years": (1990, 1994, 1998, 2002, 2005, 2009)},
+}
+
+# A case regresses if it is this much slower/bigger than the baseline...
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+# ...and the difference is above the noise floor
+TIME_FLOOR_S = 0.005
+MEMORY_FLOOR_MB = 1.0
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def measure(func, repeat):
+    """Best wall time of `repeat` runs, and the tracemalloc peak (MB) of one more run."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_s": round(min(times), 4), "peak_mb": round(peak / 2**20, 2)}
+
+
+def prepare_inputs(size, work_dir):
+    """Write the synthetic atlas files and build the municipality tables of one size."""
+    spec = SIZES[size]
+    tiles_dir = os.path.join(work_dir, size, "geotiles")
+    attributes_dir = os.path.join(work_dir, size, "attributes")
+    n_areas = synthetic.write_geotiles(tiles_dir, spec["regions"])
+    synthetic.write_attributes(attributes_dir, spec["regions"])
+    gem_data = synthetic.municipalities(spec["municipalities"])
+    border, region = synthetic.hre_region(gem_data)
+    print(f"🔹 {size}: {spec['regions']} regions ({n_areas} tile areas), "
+          f"{spec['municipalities']} municipalities x {len(spec['years'])} elections")
+    return {
+        "tiles_dir": tiles_dir,
+        "attributes_dir": attributes_dir,
+        "gem_data": gem_data,
+        "religion_data": synthetic.religion_table(gem_data),
+        "df_national": synthetic.election_panel(gem_data, spec["years"]),
+        "border": border,
+        "region": region,
+    }
+
+
+def plot_case(map_data, render):
+    """One single-column map, saved to memory instead of a file."""
+    def run():
+        LABEL_CACHE.clear()
+        plot_map_religion(map_data, render=render, lod=False)
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format="png", dpi=150)
+        plt.close("all")
+    return run
+
+
+def bench_cases(inputs, zoomLevel=1):
+    """`{name: function}` of the benchmark cases; setup that is not measured runs here."""
+    tiles = list_tiles(inputs["tiles_dir"])
+    atlas = build_geodata(inputs["tiles_dir"], zoomLevel)
+    gem_data = inputs["gem_data"]
+    centroids = gem_data.geometry.centroid.values
+    map_data = join_tables(gem_data, [(inputs["religion_data"], 'SDV_ARS', 'Region_Code')], report=False)
+    return {
+        "parse_js_file": lambda: [parse_js_file(path, row, col, zoomLevel) for row, col, path in tiles],
+        "build_geodata": lambda: build_geodata(inputs["tiles_dir"], zoomLevel),
+        "parse_attributes": lambda: parse_attributes(inputs["attributes_dir"]),
+        "stitch_tiles": lambda: stitch_tiles(atlas, zoomLevel),
+        "signed_distance": lambda: signed_distance_to_border(centroids, inputs["border"], inputs["region"]),
+        "join_tables": lambda: join_tables(gem_data, [
+            (inputs["df_national"].rename(columns={'ags': 'ags_election'}), 'AGS', 'ags_election'),
+            (inputs["religion_data"], 'SDV_ARS', 'Region_Code'),
+        ], report=False),
+        "plot_raster": plot_case(map_data, "raster"),
+        "plot_vector": plot_case(map_data, "vector"),
+    }
+
+
+def run_suite(sizes, repeat, work_dir, cases=None):
+    """Results of every case and size: `{size: {case: {"time_s", "peak_mb"}}}`."""
+    results = {}
+    for size in sizes:
+        inputs = prepare_inputs(size, work_dir)
+        results[size] = {}
+        for name, func in bench_cases(inputs).items():
+            if cases and name not in cases:
+                continue
+            results[size][name] = measure(func, repeat)
+            print(f"   {name:<18} {results[size][name]['time_s']:>9.4f} s {results[size][name]['peak_mb']:>9.2f} MB")
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_baseline(results, path, repeat):
+    """Merge `results` into the baseline file (sizes that were not run are kept)."""
+    baseline = load_baseline(path) or {"results": {}}
+    baseline["machine"] = machine_info()
+    baseline["repeat"] = repeat
+    baseline["recorded"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for size, cases in results.items():
+        baseline["results"].setdefault(size, {}).update(cases)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(baseline, file, indent=1)
+    print(f"✅ Baseline saved to {path}")
+
+
+def compare(results, baseline):
+    """Print every case against the baseline and return the list of regressions."""
+    if baseline["machine"] != machine_info():
+        print(f"⚠️ Baseline was recorded on another machine ({baseline['machine']}); differences may not be regressions")
+    regressions = []
+    for size, cases in results.items():
+        for name, result in cases.items():
+            reference = baseline["results"].get(size, {}).get(name)
+            if reference is None:
+                print(f"⏩ {size}/{name}: no baseline")
+                continue
+            time_ratio = result["time_s"] / max(reference["time_s"], 1e-9)
+            memory_ratio = result["peak_mb"] / max(reference["peak_mb"], 1e-9)
+            slower = (result["time_s"] > reference["time_s"] * (1 + TIME_TOLERANCE)
+                      and result["time_s"] - reference["time_s"] > TIME_FLOOR_S)
+            bigger = (result["peak_mb"] > reference["peak_mb"] * (1 + MEMORY_TOLERANCE)
+                      and result["peak_mb"] - reference["peak_mb"] > MEMORY_FLOOR_MB)
+            flag = "⚠️" if slower or bigger else "✅"
+            print(f"{flag} {size}/{name}: time x{time_ratio:.2f}, memory x{memory_ratio:.2f}")
+            if slower:
+                regressions.append(f"{size}/{name}: {reference['time_s']} s -> {result['time_s']} s")
+            if bigger:
+                regressions.append(f"{size}/{name}: {reference['peak_mb']} MB -> {result['peak_mb']} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic inputs.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"])
+    parser.add_argument("--cases", nargs="+", help="only run these cases")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (the best one counts)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--work-dir", help="folder for the synthetic inputs (default: a temporary folder)")
+    args = parser.parse_args(argv)
+
+    if args.work_dir:
+        results = run_suite(args.sizes, args.repeat, args.work_dir, args.cases)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_suite(args.sizes, args.repeat, work_dir, args.cases)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline, args.repeat)
+        return 0
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"⚠️ No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+    regressions = compare(results, baseline)
+    if regressions:
+        print("❌ Regressions:\n  " + "\n  ".join(regressions))
+        return 1
+    print("🎯 No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
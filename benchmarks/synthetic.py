@@ -0,0 +1,203 @@
+"""
+Generators of synthetic pipeline inputs of configurable size: GEOTILES `.JS` image-map
+tiles, ATTRIBUTES `add_content(...)` files, and VG250-like municipalities with matching
+Zensus religion and election tables. Everything is deterministic for a given seed.
+
+Regions are Voronoi cells whose edges are densified and bent by one smooth, invertible
+displacement field, so borders look hand-drawn while neighbours still share them exactly.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from src.get_data.fun_get_data import g_baseMapExt, g_geoTileSize, get_zoomFactor
+
+# Germany in EPSG:25832 (the VG250 CRS), roughly
+MUNICIPALITY_BOUNDS = (280_000, 5_230_000, 920_000, 6_110_000)
+CONFESSIONS = ["ka", "ev", "mk", "ref"]
+TERRITORY_TYPES = ["r", "a"]
+
+
+def voronoi_cells(n, bounds, rng):
+    """`n` Voronoi cells of uniformly random seed points, clipped to `bounds`."""
+    minx, miny, maxx, maxy = bounds
+    points = np.column_stack([rng.uniform(minx, maxx, n), rng.uniform(miny, maxy, n)])
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points)))
+    return shapely.intersection(cells, shapely.box(*bounds))
+
+
+def wiggle(geometries, bounds, n, vertices, rng):
+    """
+    Densify cells to about `vertices` vertices each and bend them with a smooth
+    displacement field. The field's slope stays well below 1, so it is invertible and
+    valid, gap-free coverages stay valid and gap-free. Coordinates are rounded to a
+    1e-3 grid, so the points that `segmentize` adds to both sides of a shared edge
+    coincide exactly.
+    """
+    minx, miny, maxx, maxy = bounds
+    side = np.sqrt((maxx - minx) * (maxy - miny) / n)
+    geometries = shapely.segmentize(geometries, max(4 * side / vertices, side / 1000))
+    wavelength, amplitude = side, side / 20
+    phase = rng.uniform(0, 2 * np.pi, 4)
+
+    def shift(xy):
+        x, y = xy[:, 0] * 2 * np.pi / wavelength, xy[:, 1] * 2 * np.pi / wavelength
+        dx = np.sin(y + phase[0]) * np.cos(x / 1.3 + phase[1])
+        dy = np.sin(x + phase[2]) * np.cos(y / 0.7 + phase[3])
+        return np.round(xy + amplitude * np.column_stack([dx, dy]), 3)
+    return shapely.transform(geometries, shift)
+
+
+def html_entities(text, ascii_only=False):
+    """Encode text like the atlas does: every character (`&#66;&#114;...`), or only non-ASCII ones."""
+    return "".join(char if ascii_only and ord(char) < 128 else f"&#{ord(char)};" for char in text)
+
+
+def region_name(region_id):
+    return f"Herrschaft {region_id} (Reichsstädte)"
+
+
+def atlas_regions(n_regions, vertices=60, zoomLevel=1, seed=0):
+    """
+    Atlas polities in map pixel coordinates: about `1.2 * n_regions` cells, so some
+    regions have exclaves. Returns `(cells, region_ids, (width, height))`.
+    """
+    rng = np.random.default_rng(seed)
+    width = g_baseMapExt[0] * get_zoomFactor(zoomLevel)
+    height = g_baseMapExt[1] * get_zoomFactor(zoomLevel)
+    bounds = (0, 0, width, height)
+    n_cells = int(n_regions * 1.2)
+    cells = wiggle(voronoi_cells(n_cells, bounds, rng), bounds, n_cells, vertices, rng)
+    region_ids = np.concatenate([np.arange(n_regions), rng.integers(0, n_regions, n_cells - n_regions)])
+    return cells, region_ids, (width, height)
+
+
+def write_geotiles(output_dir, n_regions, vertices=60, zoomLevel=1, seed=0):
+    """
+    Write GEOTILES `{x}_{y}.JS` files in the atlas' image-map format: every region cut
+    at the tile edges, one `<area shape="poly">` per piece with integer pixel
+    coordinates. Returns the number of areas written.
+    """
+    cells, region_ids, (width, height) = atlas_regions(n_regions, vertices, zoomLevel, seed)
+    tree = shapely.STRtree(cells)
+    tile_w, tile_h = g_geoTileSize
+    os.makedirs(output_dir, exist_ok=True)
+    n_areas = 0
+    for x in range(int(np.ceil(width / tile_w))):
+        for y in range(int(np.ceil(height / tile_h))):
+            box = (x * tile_w, y * tile_h, (x + 1) * tile_w, (y + 1) * tile_h)
+            hits = np.sort(tree.query(shapely.box(*box)))
+            areas = []
+            for index in hits:
+                for part in shapely.get_parts(shapely.clip_by_rect(cells[index], *box)):
+                    if shapely.get_type_id(part) != 3:
+                        continue
+                    ring = np.round(shapely.get_coordinates(part.exterior)).astype(np.int64)
+                    ring = ring[np.r_[True, (np.diff(ring, axis=0) != 0).any(axis=1)]]
+                    if len(ring) < 4:
+                        continue
+                    region_id = int(region_ids[index])
+                    areas.append(
+                        f'<area shape="poly" coords="{",".join(map(str, ring.ravel()))}" '
+                        f'href="javascript:show_popup({region_id});" id="{region_id}_area" '
+                        f'title="{html_entities(region_name(region_id))}"/>'
+                    )
+            with open(os.path.join(output_dir, f"{x}_{y}.JS"), "w", encoding="utf-8") as file:
+                file.write(f"addto_gI({zoomLevel},{x},{y},\"poly\",'{''.join(areas)}');\n")
+            n_areas += len(areas)
+    return n_areas
+
+
+def write_attributes(output_dir, n_regions, per_file=10, seed=0):
+    """Write ATTRIBUTES `{k}.JS` files with `per_file` regions each, as the atlas serves them."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    for k in range(int(np.ceil(n_regions / per_file))):
+        lines = []
+        for region_id in range(k * per_file, min((k + 1) * per_file, n_regions)):
+            name = region_name(region_id)
+            lines.append(f'createitem_dataCache({region_id},"{html_entities(name)}");')
+            lines.append(
+                f'add_content({region_id},"HT_NAME||{html_entities(name, ascii_only=True)}","Konf||{rng.choice(CONFESSIONS)}",'
+                f'"Geb||{rng.choice(TERRITORY_TYPES)}","W_G||w");'
+            )
+            lines.append(f'add_bestView({region_id},1,"{rng.integers(0, 4000)},{rng.integers(0, 4000)},4");')
+        with open(os.path.join(output_dir, f"{k}.JS"), "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def municipalities(n, vertices=250, bounds=MUNICIPALITY_BOUNDS, seed=0):
+    """
+    VG250-like municipality layer (EPSG:25832) with `AGS`, `SDV_ARS`, `SN_L` and `GEN`.
+    States are a 4 x 4 grid over `bounds`; codes are unique and sorted by state.
+    """
+    rng = np.random.default_rng(seed)
+    cells = wiggle(voronoi_cells(n, bounds, rng), bounds, n, vertices, rng)
+    minx, miny, maxx, maxy = bounds
+    centers = shapely.get_coordinates(shapely.centroid(cells))
+    column = np.minimum(((centers[:, 0] - minx) / (maxx - minx) * 4).astype(int), 3)
+    row = np.minimum(((centers[:, 1] - miny) / (maxy - miny) * 4).astype(int), 3)
+    state = row * 4 + column + 1
+    order = np.lexsort([centers[:, 0], state])
+    state = state[order]
+    ags = [f"{s:02d}{i:06d}" for i, s in enumerate(state)]
+    return gpd.GeoDataFrame(
+        {
+            "AGS": ags,
+            "SDV_ARS": [f"{code[:5]}{code[2:]}0" for code in ags],
+            "SN_L": [f"{s:02d}" for s in state],
+            "GEN": [f"Gemeinde {code}" for code in ags],
+        },
+        geometry=cells[order],
+        crs="EPSG:25832",
+    )
+
+
+def religion_table(gem_data, seed=0):
+    """Cleaned Zensus religion table (see `clean_religion_data`) for the municipalities."""
+    rng = np.random.default_rng(seed)
+    shares = rng.dirichlet([2, 2, 1.5, 0.5], len(gem_data)) * 100
+    return pd.DataFrame({
+        "Region_Code": gem_data["SDV_ARS"].to_numpy(),
+        "Region_Name": gem_data["GEN"].to_numpy(),
+        "Population_Type": "Bevölkerung",
+        "Unit": "Anzahl",
+        "Total_Population": rng.integers(200, 200_000, len(gem_data)).astype(float),
+        "Protestant": shares[:, 0].round(1),
+        "Catholic": shares[:, 1].round(1),
+        "None": shares[:, 2].round(1),
+    })
+
+
+def election_panel(gem_data, years=(1990, 1994, 1998, 2002, 2005, 2009), seed=0):
+    """Harmonized election panel: one row per municipality (`ags`) and election year."""
+    rng = np.random.default_rng(seed)
+    n = len(gem_data) * len(years)
+    shares = rng.dirichlet([4, 3.5, 1, 1, 1], n) * 100
+    return pd.DataFrame({
+        "ags": np.tile(gem_data["AGS"].to_numpy(), len(years)),
+        "election_year": np.repeat(years, len(gem_data)),
+        "turnout": rng.uniform(60, 90, n).round(2),
+        "cdu_csu": shares[:, 0],
+        "spd": shares[:, 1],
+        "gruene": shares[:, 2],
+        "fdp": shares[:, 3],
+        "other": shares[:, 4],
+    })
+
+
+def hre_region(gem_data, seed=0):
+    """
+    A synthetic historical region over part of the municipalities, and its border inside
+    the national boundary (as prepared in data_manage.py). Returns `(border, region)`.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = gem_data.total_bounds
+    bounds = (minx, miny, maxx, maxy)
+    blob = shapely.Point((minx + maxx) / 2, (miny + maxy) / 2).buffer(0.35 * (maxx - minx), quad_segs=64)
+    blob = wiggle(np.array([blob]), bounds, 16, 2000, rng)[0]
+    boundary = shapely.coverage_union_all(gem_data.geometry.values)
+    return blob.boundary.intersection(boundary), blob.intersection(boundary)
@@ -1,11 +1,18 @@
 import os
-import pyreadr
 import geopandas as gpd
 
-from fun_manage import (
+from src.data_management.fun_manage import (
     load_geodata,
-    load_religion_data,
-    merge_data_religion
+    load_religion_data
+)
+from src.fun_join import join_tables
+from src.fun_profile import profile_stage
+from src.data_management.fun_ingest import load_election_panel
+from src.data_management.fun_boundaries import load_national_boundary
+from src.data_management.fun_distance import (
+    nearest_polity_border,
+    polity_border_distances,
+    signed_distance_to_border
 )
 
 # ----------------------------------------------------------------------
@@ -15,110 +22,142 @@ geo_filepath = '../../data/shapefiles/vg250_ebenen_1231/DE_VG250.gpkg'
 religion_filepath = '../../data/zensus/religion.xlsx'
 national_rds_path = '../../data/election/federal_muni_harm.rds'
 hre_filepath = "../data/hre/digital_atlas/maptiles/WHRE.shp"  
+enriched_filepath = "../../data/hre/digital_atlas/map/enriched_map.shp"
 
 output_folder = "../../bld/data/"
-os.makedirs(output_folder, exist_ok=True)
-
-# ----------------------------------------------------------------------
-# 2. Load Data
-# ----------------------------------------------------------------------
-# Load Religion Data
-religion_data = load_religion_data(religion_filepath)
-
-# Load Election Data
-result_national = pyreadr.read_r(national_rds_path)
-df_national = result_national[None]
 
-# Load Geospatial Data (Municipalities)
-gem_data = load_geodata(geo_filepath)
+# Election panel slice to load (None keeps all columns / all election years)
+election_columns = None
+election_years = None
 
 # Define the SN_L keys corresponding to current West German states.
 # (Adjust these keys as needed for your dataset.)
 west_germany_keys = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10']
 
-# Filter municipalities to only include those in West Germany.
-west_germany_admin = gem_data[gem_data["SN_L"].isin(west_germany_keys)].copy()
-
-# Load the historical Catholic HRE polygon and ensure CRS match.
-catholic_hre = gpd.read_file(hre_filepath)
-catholic_hre = catholic_hre.to_crs(west_germany_admin.crs)
-
-# ----------------------------------------------------------------------
-# 3. PREPARE THE HRE BOUNDARY FOR WEST GERMANY
-# ----------------------------------------------------------------------
-# Compute the full union of the HRE polygon(s)
-hre_union = catholic_hre.unary_union
-
-# Compute the West Germany boundary as a single polygon (union of West German municipalities)
-west_germany_boundary = west_germany_admin.geometry.unary_union
-
-# Obtain only those parts of the HRE boundary that lie within West Germany.
-# This gives the boundary segments used for distance calculations.
-internal_west_hre_border = hre_union.boundary.intersection(west_germany_boundary)
-
-# Also, compute the West German portion of the HRE region. This will be used to assign
-# a positive (treated) sign to municipalities inside the HRE.
-west_hre_polygon = hre_union.intersection(west_germany_boundary)
-
-# ----------------------------------------------------------------------
-# 4. COMPUTE DISTANCES (RUNNING VARIABLE)
-# ----------------------------------------------------------------------
-# Compute centroids for each West German municipality
-west_germany_admin["centroid"] = west_germany_admin.geometry.centroid
-
-# For each municipality, compute the distance from its centroid to the internal HRE border (only within West Germany)
-west_germany_admin["distance_to_border"] = west_germany_admin["centroid"].apply(
-    lambda pt: pt.distance(internal_west_hre_border)
-)
-
-# Assign a signed distance:
-#   Positive if the centroid lies within the West HRE polygon (historically Catholic),
-#   Negative if outside (historically Protestant).
-west_germany_admin["signed_distance_to_border"] = west_germany_admin.apply(
-    lambda row: row["distance_to_border"] if west_hre_polygon.contains(row["centroid"]) else -row["distance_to_border"],
-    axis=1
-)
-
-# Optionally, drop the temporary centroid column
-west_germany_admin = west_germany_admin.drop(columns=["centroid"])
-
-# ----------------------------------------------------------------------
-# 5. MERGE COMPUTED DISTANCES WITH THE FULL GEOSPATIAL DATA
-# ----------------------------------------------------------------------
-# Merge the signed distance from the West German subset into the full municipalities data.
-# Municipalities outside West Germany will have missing (NaN) signed_distance_to_border.
-gem_data = gem_data.merge(
-    west_germany_admin[['AGS', 'signed_distance_to_border']],
-    on='AGS',
-    how='left'
-)
-
-# ----------------------------------------------------------------------
-# 6. MERGE GEOSPATIAL DATA WITH ELECTION AND RELIGION DATA
-# ----------------------------------------------------------------------
-# Rename 'ags' in election data to avoid conflict.
-df_national = df_national.rename(columns={'ags': 'ags_election'})
-
-# Merge Election Data with Municipalities.
-map_data_national = gem_data.merge(df_national, left_on='AGS', right_on='ags_election', how='left')
-
-# Merge with Religion Data.
-map_data_national = merge_data_religion(map_data_national, religion_data)
-
-# Drop duplicate 'AGS' column if present.
-map_data_national = map_data_national.drop(columns=['ags'], errors='ignore')
-
-# ----------------------------------------------------------------------
-# 7. SAVE CLEANED DATASET WITH SIGNED DISTANCE & CLIPPED HRE POLYGON
-# ----------------------------------------------------------------------
-# Define the output geopackage file path.
-output_filepath = f"{output_folder}merged_national_with_signed_distance.gpkg"
-
-# Save the merged municipality data as one layer (e.g., "municipalities").
-map_data_national.to_file(output_filepath, driver="GPKG", layer="municipalities")
-
-# Save the clipped HRE polygon (West German portion) as a separate layer.
-west_hre_gdf = gpd.GeoDataFrame({'geometry': [west_hre_polygon]}, crs=west_germany_admin.crs)
-west_hre_gdf.to_file(output_filepath, driver="GPKG", layer="west_hre_polygon")
-
-print("✅ Clean dataset with signed distance and clipped HRE polygon saved in:", output_filepath)
+def build_merged_dataset(religion_data, df_national, gem_data, geo_filepath=geo_filepath,
+                         hre_filepath=hre_filepath, enriched_filepath=enriched_filepath,
+                         output_folder=output_folder):
+    """
+    Compute the border distances of the West German municipalities, merge them with
+    the election and religion data and save the result (see sections 3 to 7).
+    Returns the path of the merged GeoPackage.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Filter municipalities to only include those in West Germany.
+    west_germany_admin = gem_data[gem_data["SN_L"].isin(west_germany_keys)].copy()
+
+    # Load the historical Catholic HRE polygon and ensure CRS match.
+    catholic_hre = gpd.read_file(hre_filepath)
+    catholic_hre = catholic_hre.to_crs(west_germany_admin.crs)
+
+    # ----------------------------------------------------------------------
+    # 3. PREPARE THE HRE BOUNDARY FOR WEST GERMANY
+    # ----------------------------------------------------------------------
+    # Compute the full union of the HRE polygon(s)
+    hre_union = catholic_hre.unary_union
+
+    # West Germany boundary as a single polygon (union of West German municipalities),
+    # cached next to the GeoPackage so it is only rebuilt when the source changes
+    west_germany_boundary = load_national_boundary(geo_filepath, state_keys=west_germany_keys)
+
+    # Obtain only those parts of the HRE boundary that lie within West Germany.
+    # This gives the boundary segments used for distance calculations.
+    internal_west_hre_border = hre_union.boundary.intersection(west_germany_boundary)
+
+    # Also, compute the West German portion of the HRE region. This will be used to assign
+    # a positive (treated) sign to municipalities inside the HRE.
+    west_hre_polygon = hre_union.intersection(west_germany_boundary)
+
+    # ----------------------------------------------------------------------
+    # 4. COMPUTE DISTANCES (RUNNING VARIABLE)
+    # ----------------------------------------------------------------------
+    # Compute centroids for each West German municipality
+    west_germany_admin["centroid"] = west_germany_admin.geometry.centroid
+
+    # For each municipality, compute the distance from its centroid to the internal HRE border (only within West Germany)
+    # and assign a signed distance:
+    #   Positive if the centroid lies within the West HRE polygon (historically Catholic),
+    #   Negative if outside (historically Protestant).
+    # Both are computed in bulk against an STRtree of the border segments and a prepared polygon.
+    distance, signed_distance = signed_distance_to_border(
+        west_germany_admin["centroid"].values, internal_west_hre_border, west_hre_polygon
+    )
+    west_germany_admin["distance_to_border"] = distance
+    west_germany_admin["signed_distance_to_border"] = signed_distance
+
+    # Nearest polity border in the enriched atlas map (region_id, Konf, Geb), with the pair of
+    # polities it separates, plus each municipality's distance to every polity border within 50 km.
+    polities = gpd.read_file(enriched_filepath).to_crs(west_germany_admin.crs)
+    nearest_border = nearest_polity_border(west_germany_admin["centroid"].values, polities)
+    west_germany_admin["polity_border_distance"] = nearest_border["distance"].to_numpy()
+    for column in ["border_id", "left_id", "right_id", "left_Konf", "right_Konf", "left_Geb", "right_Geb"]:
+        west_germany_admin[f"polity_{column}"] = nearest_border[column].to_numpy()
+
+    polity_distances = polity_border_distances(west_germany_admin["centroid"].values, polities, max_distance=50_000)
+    polity_distances["AGS"] = west_germany_admin["AGS"].to_numpy()[polity_distances["point"]]
+
+    # Optionally, drop the temporary centroid column
+    west_germany_admin = west_germany_admin.drop(columns=["centroid"])
+
+    # ----------------------------------------------------------------------
+    # 5. MERGE COMPUTED DISTANCES, ELECTION AND RELIGION DATA WITH THE MUNICIPALITIES
+    # ----------------------------------------------------------------------
+    # Rename 'ags' in election data to avoid conflict.
+    df_national = df_national.rename(columns={'ags': 'ags_election'})
+
+    # One pass over integer-normalized keys, without copying the geometry per merge:
+    # - the signed distance from the West German subset (NaN outside West Germany),
+    # - the election data (one row per municipality and election),
+    # - the religion data.
+    polity_columns = [column for column in west_germany_admin.columns if column.startswith("polity_")]
+    map_data_national = join_tables(gem_data, [
+        (west_germany_admin, 'AGS', 'AGS', ['AGS', 'signed_distance_to_border'] + polity_columns),
+        (df_national, 'AGS', 'ags_election'),
+        (religion_data, 'SDV_ARS', 'Region_Code'),
+    ])
+
+    # Drop duplicate 'AGS' column if present.
+    map_data_national = map_data_national.drop(columns=['ags'], errors='ignore')
+
+    # ----------------------------------------------------------------------
+    # 7. SAVE CLEANED DATASET WITH SIGNED DISTANCE & CLIPPED HRE POLYGON
+    # ----------------------------------------------------------------------
+    # Define the output geopackage file path.
+    output_filepath = os.path.join(output_folder, "merged_national_with_signed_distance.gpkg")
+
+    with profile_stage("write_gpkg", data=map_data_national):
+        # Save the merged municipality data as one layer (e.g., "municipalities").
+        map_data_national.to_file(output_filepath, driver="GPKG", layer="municipalities")
+
+        # Save the clipped HRE polygon (West German portion) as a separate layer.
+        west_hre_gdf = gpd.GeoDataFrame({'geometry': [west_hre_polygon]}, crs=west_germany_admin.crs)
+        west_hre_gdf.to_file(output_filepath, driver="GPKG", layer="west_hre_polygon")
+
+    print("✅ Clean dataset with signed distance and clipped HRE polygon saved in:", output_filepath)
+
+    # Save the long municipality × polity border distance table.
+    polity_distances_filepath = os.path.join(output_folder, "polity_border_distances.parquet")
+    polity_distances[["AGS", "region_id", "distance"]].to_parquet(polity_distances_filepath, index=False)
+    print("✅ Municipality-to-polity border distances saved in:", polity_distances_filepath)
+    return output_filepath
+
+
+def main():
+    # ----------------------------------------------------------------------
+    # 2. Load Data
+    # ----------------------------------------------------------------------
+    # Load Religion Data
+    religion_data = load_religion_data(religion_filepath)
+
+    # Load Election Data
+    df_national = load_election_panel(national_rds_path, columns=election_columns, years=election_years)
+
+    # Load Geospatial Data (Municipalities)
+    gem_data = load_geodata(geo_filepath)
+
+    build_merged_dataset(religion_data, df_national, gem_data)
+
+
+if __name__ == "__main__":
+    main()
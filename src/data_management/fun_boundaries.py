@@ -0,0 +1,71 @@
+import os
+
+import geopandas as gpd
+import shapely
+
+from src.fun_cache import cache_key, cached_file_sha256, default_cache_dir
+
+
+def write_parquet_atomic(gdf, path):
+    """Write GeoParquet via a per-process temporary file, so concurrent pipeline stages never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    gdf.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def build_state_boundaries(geo_filepath, state_keys=None, layer="vg250_gem"):
+    """
+    Build one outline per state (`SN_L`) from the municipality layer. The municipalities
+    form a clean coverage, so each state is merged with a coverage union, which only
+    drops shared edges instead of running a full overlay.
+    """
+    gem_data = gpd.read_file(geo_filepath, layer=layer, columns=["SN_L"])
+    if state_keys is not None:
+        gem_data = gem_data[gem_data["SN_L"].isin(state_keys)]
+    states = [
+        (key, shapely.coverage_union_all(group.geometry.values))
+        for key, group in gem_data.groupby("SN_L", sort=True)
+    ]
+    return gpd.GeoDataFrame(
+        {"SN_L": [key for key, _ in states]},
+        geometry=[geometry for _, geometry in states],
+        crs=gem_data.crs,
+    )
+
+
+def load_state_boundaries(geo_filepath, state_keys=None, cache_dir=None, refresh=False):
+    """
+    State outlines for the given `SN_L` keys (all states if None), cached as GeoParquet
+    keyed by the source file's hash and the state filter.
+    """
+    cache_dir = cache_dir or default_cache_dir(geo_filepath)
+    keys = None if state_keys is None else sorted(state_keys)
+    digest = cache_key(cached_file_sha256(geo_filepath, cache_dir), "states", keys)
+    path = os.path.join(cache_dir, f"boundaries_states_{digest}.parquet")
+    if os.path.exists(path) and not refresh:
+        return gpd.read_parquet(path)
+
+    states = build_state_boundaries(geo_filepath, state_keys)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_parquet_atomic(states, path)
+    print(f"✅ Cached state boundaries at {path}")
+    return states
+
+
+def load_national_boundary(geo_filepath, state_keys=None, cache_dir=None, refresh=False):
+    """
+    Single outline of the selected states (e.g. West Germany, or all of Germany if
+    `state_keys` is None), built from the cached state outlines and cached itself.
+    """
+    cache_dir = cache_dir or default_cache_dir(geo_filepath)
+    keys = None if state_keys is None else sorted(state_keys)
+    digest = cache_key(cached_file_sha256(geo_filepath, cache_dir), "national", keys)
+    path = os.path.join(cache_dir, f"boundaries_national_{digest}.parquet")
+    if os.path.exists(path) and not refresh:
+        return gpd.read_parquet(path).geometry.iloc[0]
+
+    states = load_state_boundaries(geo_filepath, state_keys, cache_dir, refresh)
+    national = gpd.GeoDataFrame(geometry=[states.geometry.union_all()], crs=states.crs)
+    write_parquet_atomic(national, path)
+    print(f"✅ Cached national boundary at {path}")
+    return national.geometry.iloc[0]
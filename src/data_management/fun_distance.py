@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.fun_profile import profiled
+
+
+def flatten_parts(geometries):
+    """Explode (nested) multi-part geometries and collections into single-part geometries."""
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    while True:
+        multi = shapely.get_type_id(parts) >= 4
+        if not multi.any():
+            return parts, index
+        sub_parts, sub_index = shapely.get_parts(parts[multi], return_index=True)
+        parts = np.concatenate([parts[~multi], sub_parts])
+        index = np.concatenate([index[~multi], index[multi][sub_index]])
+
+
+def border_segments(border, return_index=False):
+    """
+    Split border geometries into two-point LineStrings (isolated points are kept as
+    points). The distance to a line is the minimum distance to its segments, so
+    distances to the segments reproduce distances to the whole border exactly.
+    With `return_index`, also return which input geometry each segment came from.
+    """
+    parts, part_index = flatten_parts(np.atleast_1d(np.asarray(border, dtype=object)))
+    type_id = shapely.get_type_id(parts)
+    points = parts[type_id == 0]
+    lines = parts[(type_id == 1) | (type_id == 2)]
+    line_index = part_index[(type_id == 1) | (type_id == 2)]
+
+    coords, vertex_index = shapely.get_coordinates(lines, return_index=True)
+    same_line = vertex_index[1:] == vertex_index[:-1]
+    segments = shapely.linestrings(np.stack([coords[:-1][same_line], coords[1:][same_line]], axis=1))
+    geometries = np.concatenate([segments, points])
+    if return_index:
+        source = np.concatenate([line_index[vertex_index[:-1][same_line]], part_index[type_id == 0]])
+        return geometries, source
+    return geometries
+
+
+def nearest_distance(points, border):
+    """
+    Distance from every point to `border`, computed with one bulk nearest-neighbour
+    query against an STRtree of the border's segments. Empty points get NaN.
+    """
+    points = np.asarray(points, dtype=object)
+    tree = shapely.STRtree(border_segments(border))
+    distances = np.full(len(points), np.nan)
+    (point_index, _), nearest = tree.query_nearest(points, return_distance=True, all_matches=False)
+    distances[point_index] = nearest
+    return distances
+
+
+@profiled(counts=lambda result: {"rows": len(result[0])})
+def signed_distance_to_border(points, border, region):
+    """
+    Return `(distance, signed_distance)` from every point to `border`. The sign is
+    positive for points inside `region` and negative outside, tested with a prepared
+    `region` in one vectorized `contains` call.
+    """
+    points = np.asarray(points, dtype=object)
+    distances = nearest_distance(points, border)
+    shapely.prepare(region)
+    inside = shapely.contains(region, points)
+    return distances, np.where(inside, distances, -distances)
+
+
+def polity_borders(polities, id_column="region_id", tolerance=1.0):
+    """
+    Split the boundaries of all polities into segments labelled with the polities on
+    either side. `left_id` is the polity the segment was taken from and `right_id` its
+    neighbour across the segment (-1 if none, e.g. the outer edge of the map); if several
+    neighbours touch the segment, the one sharing most of its length. Borders
+    of neighbours only need to agree within `tolerance`, so each side of a shared
+    border keeps its own segments, and both get the same `border_id`, a code for the
+    unordered polity pair.
+    Returns a DataFrame with `geometry` (segments), `left_id`, `right_id` and `border_id`.
+    """
+    ids = polities[id_column].to_numpy()
+    boundaries = shapely.boundary(np.asarray(polities.geometry.values, dtype=object))
+    segments, source = border_segments(boundaries, return_index=True)
+    left_id = ids[source]
+
+    # The neighbour is the other polity whose boundary runs through the segment midpoint
+    midpoints = shapely.line_interpolate_point(segments, 0.5, normalized=True)
+    segment_index, polity_index = shapely.STRtree(boundaries).query(
+        midpoints, predicate="dwithin", distance=tolerance
+    )
+    other = polity_index != source[segment_index]
+    segment_index, polity_index = segment_index[other], polity_index[other]
+    # Where a segment touches several neighbours (near junctions), take the one sharing
+    # the longest stretch of it, then the smallest id, so the pair does not depend on
+    # the order of the tree query
+    shared = np.zeros(len(segment_index))
+    ambiguous = np.bincount(segment_index, minlength=len(segments))[segment_index] > 1
+    if ambiguous.any():
+        window = shapely.box(
+            *(shapely.bounds(segments[segment_index[ambiguous]]) + [-tolerance, -tolerance, tolerance, tolerance]).T
+        )
+        near = shapely.intersection(boundaries[polity_index[ambiguous]], window)
+        shared[ambiguous] = shapely.length(
+            shapely.intersection(segments[segment_index[ambiguous]], shapely.buffer(near, tolerance))
+        )
+    order = np.lexsort([ids[polity_index], -shared, segment_index])
+    first = order[np.r_[True, segment_index[order][1:] != segment_index[order][:-1]]] if len(order) else order
+    right_id = np.full(len(segments), -1, dtype=np.int64)
+    right_id[segment_index[first]] = ids[polity_index[first]]
+
+    borders = pd.DataFrame({"geometry": segments, "left_id": left_id, "right_id": right_id})
+    pairs = pd.MultiIndex.from_arrays([
+        np.where(right_id == -1, left_id, np.minimum(left_id, right_id)),
+        np.where(right_id == -1, -1, np.maximum(left_id, right_id)),
+    ])
+    borders["border_id"] = pd.factorize(pairs, sort=True)[0]
+    return borders
+
+
+@profiled()
+def nearest_polity_border(points, polities, id_column="region_id", attributes=("Konf", "Geb"), borders=None):
+    """
+    For every point, find the nearest polity border in one STRtree pass.
+    Returns a columnar DataFrame with the distance, the `border_id` and segment of the
+    nearest border, the polity pair (`left_id`, `right_id`) it separates, and the
+    `attributes` of both polities (`left_<attr>`, `right_<attr>`).
+    """
+    if borders is None:
+        borders = polity_borders(polities, id_column)
+    points = np.asarray(points, dtype=object)
+    tree = shapely.STRtree(borders["geometry"].to_numpy())
+    (point_index, segment_index), distances = tree.query_nearest(points, return_distance=True, all_matches=False)
+
+    result = pd.DataFrame(index=pd.RangeIndex(len(points), name="point"))
+    result["distance"] = np.nan
+    result["border_id"] = -1
+    result["segment"] = -1
+    result["left_id"] = -1
+    result["right_id"] = -1
+    result.loc[point_index, "distance"] = distances
+    result.loc[point_index, "segment"] = segment_index
+    for column in ["border_id", "left_id", "right_id"]:
+        result.loc[point_index, column] = borders[column].to_numpy()[segment_index]
+
+    lookup = polities.drop_duplicates(id_column).set_index(id_column)
+    for attribute in attributes:
+        if attribute in lookup.columns:
+            result[f"left_{attribute}"] = result["left_id"].map(lookup[attribute])
+            result[f"right_{attribute}"] = result["right_id"].map(lookup[attribute])
+    return result
+
+
+@profiled()
+def polity_border_distances(points, polities, id_column="region_id", max_distance=50_000):
+    """
+    Distance from every point to the boundary of every polity within `max_distance`,
+    as a long table with columns `point`, `<id_column>` and `distance`. All candidate
+    point/segment pairs come from one `dwithin` query against an STRtree of the
+    boundary segments, so the cost grows with the number of nearby borders rather
+    than with points × polities.
+    """
+    ids = polities[id_column].to_numpy()
+    boundaries = shapely.boundary(np.asarray(polities.geometry.values, dtype=object))
+    segments, source = border_segments(boundaries, return_index=True)
+    points = np.asarray(points, dtype=object)
+
+    point_index, segment_index = shapely.STRtree(segments).query(
+        points, predicate="dwithin", distance=max_distance
+    )
+    pairs = pd.DataFrame({
+        "point": point_index,
+        id_column: ids[source[segment_index]],
+        "distance": shapely.distance(points[point_index], segments[segment_index]),
+    })
+    return (
+        pairs.groupby(["point", id_column], sort=True, as_index=False)["distance"].min()
+    )
@@ -0,0 +1,188 @@
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pyreadr
+
+from src.fun_cache import cache_key, cached_file_sha256, default_cache_dir
+from src.fun_profile import profiled
+
+# Bump when the cleaning below changes, so old cache files are no longer picked up
+INGEST_VERSION = 1
+
+RELIGION_COLUMNS = [
+    "Region_Code", "Region_Name", "Population_Type", "Unit", "Total_Population",
+    "Protestant_e", "Protestant", "Catholic_e", "Catholic", "None_e", "None", "final_e"
+]
+
+
+def stringify_mixed(df):
+    """
+    Convert object columns that mix types (e.g. counts next to "-" or "/" markers in
+    the Zensus sheets) to strings, so they can be stored in a typed column.
+    Missing values stay NaN.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        present = df[column].dropna()
+        if present.map(type).nunique() > 1:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+
+def read_cached_frame(path):
+    """Read a cached table, restoring NaN (not None) for missing values in object columns."""
+    df = pd.read_parquet(path)
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+def cached_table_path(source_path, name, build, params=(), cache_dir=None, refresh=False, **parquet_kwargs):
+    """
+    Path of the Parquet table produced by `build()` from `source_path`, stored as
+    `<cache_dir>/<name>_<digest>.parquet` and built only if it is missing. The digest
+    covers the source file's hash, `params` and INGEST_VERSION, so the cache is rebuilt
+    whenever any of them change. `parquet_kwargs` are passed on to `to_parquet`.
+    """
+    cache_dir = cache_dir or default_cache_dir(source_path)
+    digest = cache_key(INGEST_VERSION, cached_file_sha256(source_path, cache_dir), name, params)
+    path = os.path.join(cache_dir, f"{name}_{digest}.parquet")
+    if os.path.exists(path) and not refresh:
+        return path
+
+    df = stringify_mixed(build())
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(name)}_*.parquet")):
+        os.remove(stale)
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, **parquet_kwargs)
+    os.replace(tmp_path, path)
+    print(f"✅ Cached {name} at {path}")
+    return path
+
+
+def cached_frame(source_path, name, build, params=(), cache_dir=None, refresh=False):
+    """
+    Return the table produced by `build()` from `source_path`, read back from its
+    Parquet cache (see `cached_table_path`), so a fresh build and a cache hit give
+    identical dtypes. Object columns are stored typed, e.g. integer counts with gaps
+    come back as float.
+    """
+    return read_cached_frame(cached_table_path(source_path, name, build, params, cache_dir, refresh))
+
+
+def clean_religion_data(religion_data):
+    """Name the Zensus religion columns, drop empty rows and the '_e' flag columns."""
+    religion_data.columns = RELIGION_COLUMNS
+    religion_data = religion_data.dropna(subset=["Region_Code", "Region_Name"], how='all')
+
+    # Convert relevant columns to numeric, replacing errors with NaN, then fill with 0
+    religion_data[['Protestant', 'Catholic', 'None']] = (
+        religion_data[['Protestant', 'Catholic', 'None']]
+        .apply(pd.to_numeric, errors='coerce')
+        .fillna(0)
+    )
+
+    # Drop columns ending with '_e'
+    return religion_data[[col for col in religion_data.columns if not col.endswith("_e")]]
+
+
+@profiled()
+def read_religion_data(filepath, cache_dir=None, refresh=False):
+    """Cleaned Zensus religion table, parsed from the Excel sheet only when it changes."""
+    return cached_frame(
+        filepath,
+        "religion",
+        lambda: clean_religion_data(pd.read_excel(filepath, sheet_name=0, header=3)),
+        cache_dir=cache_dir,
+        refresh=refresh,
+    )
+
+
+def read_rds(filepath, cache_dir=None, refresh=False):
+    """Data frame stored in an .rds file, converted through `pyreadr` only when it changes."""
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return cached_frame(
+        filepath,
+        name,
+        lambda: pyreadr.read_r(filepath)[None],
+        cache_dir=cache_dir,
+        refresh=refresh,
+    )
+
+
+def ags_strings(ags):
+    """AGS codes as 8-character strings, restoring leading zeros lost in numeric columns."""
+    if pd.api.types.is_numeric_dtype(ags):
+        ags = ags.astype("Int64").astype(str)
+    return ags.astype(str).str.zfill(8)
+
+
+def build_election_panel(filepath, year_column="election_year", key_column="ags"):
+    """
+    Harmonized election panel from an .rds file, with an `ags_state` column (the two
+    digit state key of the AGS) and sorted by state and year, so that Parquet row
+    group statistics can skip whole states and years when filtering.
+    """
+    df = pyreadr.read_r(filepath)[None]
+    df["ags_state"] = ags_strings(df[key_column]).str[:2]
+    return df.sort_values(["ags_state", year_column], kind="stable").reset_index(drop=True)
+
+
+@profiled()
+def load_election_panel(
+    filepath,
+    columns=None,
+    years=None,
+    ags_prefixes=None,
+    year_column="election_year",
+    key_column="ags",
+    cache_dir=None,
+    refresh=False,
+):
+    """
+    Load a slice of a harmonized election panel (`federal_muni_harm.rds`,
+    `state_harm.rds`, `municipal_harm.rds`): only `columns` (all if None), only the
+    election `years` and only municipalities whose AGS starts with one of
+    `ags_prefixes` (e.g. the West German state keys). The .rds file is converted once
+    into a Parquet cache; year and state filters are pushed down into the Parquet
+    reader, so only matching row groups and columns are read into memory.
+    """
+    path = cached_table_path(
+        filepath,
+        f"{os.path.splitext(os.path.basename(filepath))[0]}_panel",
+        lambda: build_election_panel(filepath, year_column, key_column),
+        params=(year_column, key_column),
+        cache_dir=cache_dir,
+        refresh=refresh,
+        index=False,
+        row_group_size=50_000,
+    )
+
+    filters = []
+    if years is not None:
+        filters.append((year_column, "in", list(years)))
+    if ags_prefixes is not None:
+        ags_prefixes = [str(prefix) for prefix in ags_prefixes]
+        filters.append(("ags_state", "in", sorted({prefix[:2] for prefix in ags_prefixes})))
+    if columns is not None:
+        columns = list(dict.fromkeys([key_column, year_column, *columns]))
+
+    table = pq.read_table(path, columns=columns, filters=filters or None)
+    if columns is None:
+        table = table.drop(["ags_state"])
+    df = table.to_pandas()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+
+    # Prefixes longer than a state key (e.g. districts) are matched after the pushdown
+    if ags_prefixes is not None and any(len(prefix) > 2 for prefix in ags_prefixes):
+        df = df[ags_strings(df[key_column]).str.startswith(tuple(ags_prefixes))].reset_index(drop=True)
+    return df
@@ -0,0 +1,60 @@
+import os
+import json
+import hashlib
+
+
+def default_cache_dir(filepath):
+    """Derived data is cached in a `.cache` folder next to its source file."""
+    return os.path.join(os.path.dirname(filepath), ".cache")
+
+
+def file_sha256(filepath, chunk_size=1 << 20):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_file_sha256(filepath, cache_dir):
+    """
+    SHA-256 of a (large) source file, remembered in `<cache_dir>/hashes.json` against
+    the file's size and modification time so that it is only recomputed when the file
+    changes.
+    """
+    return cached_files_sha256([filepath], cache_dir)[0]
+
+
+def cached_files_sha256(filepaths, cache_dir):
+    """`cached_file_sha256` for many files, reading and writing the hash index only once."""
+    index_path = os.path.join(cache_dir, "hashes.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as file:
+            index = json.load(file)
+
+    digests, changed = [], False
+    for filepath in filepaths:
+        key = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        entry = index.get(key)
+        if not (entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns):
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(filepath)}
+            index[key] = entry
+            changed = True
+        digests.append(entry["sha256"])
+
+    if changed:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Per-process temporary name: pipeline stages may update the same index concurrently
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(index, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, index_path)
+    return digests
+
+
+def cache_key(*parts):
+    """Short, stable digest of arbitrary key parts (hashes, filters, parameters)."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import platform
+import threading
+import functools
+from contextlib import contextmanager
+
+import psutil
+import shapely
+
+# Set to 1 to record every instrumented stage and write a JSON report at the end of the run
+PROFILE_ENV = "RELIGION_VOTING_PROFILE"
+# Name of one stage to run under cProfile (pstats file next to the report)
+PROFILE_STAGE_ENV = "RELIGION_VOTING_PROFILE_STAGE"
+# Folder of the reports (default: bld/profile)
+PROFILE_DIR_ENV = "RELIGION_VOTING_PROFILE_DIR"
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bld", "profile")
+
+RSS_INTERVAL = 0.05  # seconds between memory samples
+HOTSPOTS = 25  # functions listed from a cProfile capture
+
+# Finished stage records of this process, and the names of the stages currently running
+PROFILE_RECORDS = []
+STAGE_STACK = []
+RUN_STARTED = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def profiling_enabled():
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def profile_dir():
+    return os.environ.get(PROFILE_DIR_ENV) or PROFILE_DIR
+
+
+def frame_counts(obj):
+    """Row count of a table and, for geometries, their vertex count."""
+    counts = {}
+    if getattr(obj, "shape", None):
+        counts["rows"] = int(obj.shape[0])
+    geometry = getattr(obj, "geometry", None) if hasattr(obj, "crs") else None
+    if geometry is not None:
+        counts["vertices"] = int(shapely.get_num_coordinates(geometry.values).sum())
+    return counts
+
+
+def process_rss(process):
+    """Resident memory of a process and all its children (e.g. worker pools), in bytes."""
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+def sample_peak_rss():
+    """
+    Sample the RSS of the process tree in a background thread. Returns a function that
+    stops sampling and returns the peak in bytes.
+    """
+    process = psutil.Process()
+    peak = [process_rss(process)]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_INTERVAL):
+            try:
+                peak[0] = max(peak[0], process_rss(process))
+            except psutil.Error:
+                pass
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+
+    def stop():
+        done.set()
+        thread.join()
+        return max(peak[0], process_rss(process))
+    return stop
+
+
+def hotspots(profiler, limit=HOTSPOTS):
+    """Top functions of a cProfile capture by cumulative time."""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                     "tottime_s": round(tottime, 4), "cumtime_s": round(cumtime, 4)})
+    return sorted(rows, key=lambda row: -row["cumtime_s"])[:limit]
+
+
+@contextmanager
+def profile_stage(name, data=None, **counts):
+    """
+    Record wall time, CPU time (including reaped worker processes), peak RSS and counts
+    of the enclosed block: the rows/vertices of `data` (see `frame_counts`) plus any
+    keyword counts; more can be added to the yielded dict. Does nothing unless
+    profiling is enabled. The stage named in RELIGION_VOTING_PROFILE_STAGE also runs
+    under cProfile.
+    """
+    record = {"stage": name, **counts}
+    if not profiling_enabled():
+        yield record
+        return
+    if data is not None:
+        record.update(frame_counts(data))
+
+    record["parent"] = STAGE_STACK[-1] if STAGE_STACK else None
+    STAGE_STACK.append(name)
+    profiler = None
+    if os.environ.get(PROFILE_STAGE_ENV) == name and sys.getprofile() is None:
+        profiler = cProfile.Profile()
+    stop_sampling = sample_peak_rss()
+    times = os.times()
+    wall = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        wall = time.perf_counter() - wall
+        end = os.times()
+        record["wall_s"] = round(wall, 4)
+        record["cpu_s"] = round((end.user - times.user) + (end.system - times.system), 4)
+        record["children_cpu_s"] = round(
+            (end.children_user - times.children_user) + (end.children_system - times.children_system), 4
+        )
+        record["peak_rss_mb"] = round(stop_sampling() / 2**20, 1)
+        if profiler:
+            os.makedirs(profile_dir(), exist_ok=True)
+            stats_path = os.path.join(profile_dir(), f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.prof")
+            profiler.dump_stats(stats_path)
+            record["cprofile"] = stats_path
+            record["hotspots"] = hotspots(profiler)
+        STAGE_STACK.pop()
+        PROFILE_RECORDS.append(record)
+
+
+def profiled(name=None, counts=frame_counts):
+    """
+    Decorator running a function as a `profile_stage` (named after the function by
+    default); `counts(result)` adds row/vertex counts of the return value.
+    """
+    def decorator(func):
+        stage = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled():
+                return func(*args, **kwargs)
+            with profile_stage(stage) as record:
+                result = func(*args, **kwargs)
+                if counts is not None:
+                    record.update(counts(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def take_records():
+    """Remove and return the finished stage records of this process (e.g. to send them to the pipeline)."""
+    records = PROFILE_RECORDS[:]
+    PROFILE_RECORDS.clear()
+    return records
+
+
+def write_report(records=None, report_path=None):
+    """
+    Write a JSON report of stage records (default: all records of this process) and
+    return its path. Nothing is written if there are no records.
+    """
+    records = take_records() if records is None else records
+    if not records:
+        return None
+    report = {
+        "started": RUN_STARTED,
+        "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "command": sys.argv,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stages": records,
+    }
+    if report_path is None:
+        os.makedirs(profile_dir(), exist_ok=True)
+        report_path = os.path.join(profile_dir(), f"profile_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json")
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=1)
+    print(f"📊 Profile report written to {report_path}")
+    return report_path
+
+
+# Scripts get a report at exit; the pipeline collects the records of its stages itself
+atexit.register(lambda: profiling_enabled() and write_report())
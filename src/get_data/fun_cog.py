@@ -0,0 +1,118 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from PIL import Image
+
+from src.fun_profile import profiled
+from src.get_data.fun_get_data import g_rwUL, get_scaleFactor
+
+ATLAS_CRS = "EPSG:32633"
+MAPTILE_SIZE = 256
+MAPTILE_PATTERN = re.compile(r"R([0-9A-F]{8})_C([0-9A-F]{8})\.JPG$", re.IGNORECASE)
+COG_BLOCKSIZE = 512
+COG_OVERVIEWS = (2, 4, 8, 16)
+
+
+def scan_maptiles(maptiles_dir):
+    """`{(row, col): path}` of the downloaded atlas map tiles in `maptiles_dir`."""
+    tiles = {}
+    for filename in os.listdir(maptiles_dir):
+        match = MAPTILE_PATTERN.match(filename)
+        if match:
+            tiles[(int(match.group(1), 16), int(match.group(2), 16))] = os.path.join(maptiles_dir, filename)
+    return tiles
+
+
+def maptile_transform(r0, c0, zoomLevel=1):
+    """
+    Affine transform of a mosaic whose upper-left tile is (r0, c0). Pixel size and
+    origin follow the atlas viewer: the map spans g_baseMapExt * g_zoomFactors pixels
+    from g_rwUL, so one pixel is 1 / get_scaleFactor(zoomLevel) metres.
+    """
+    pixel = 1 / get_scaleFactor(zoomLevel)
+    return Affine(pixel, 0, g_rwUL[0] + c0 * MAPTILE_SIZE * pixel,
+                  0, -pixel, g_rwUL[1] - r0 * MAPTILE_SIZE * pixel)
+
+
+def decode_maptile(path):
+    """RGB array of one map tile (JPEG decoding releases the GIL, so threads run in parallel)."""
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def write_strip(dst, tiles, row, r0, c0, n_cols, executor):
+    """Decode one row of map tiles in parallel and write it as a single 256-pixel strip."""
+    keys = [(row, col) for col in range(c0, c0 + n_cols) if (row, col) in tiles]
+    strip = np.full((3, MAPTILE_SIZE, n_cols * MAPTILE_SIZE), 255, dtype=np.uint8)
+    mask = np.zeros((MAPTILE_SIZE, n_cols * MAPTILE_SIZE), dtype=np.uint8)
+    for (_, col), tile in zip(keys, executor.map(decode_maptile, [tiles[key] for key in keys])):
+        x = (col - c0) * MAPTILE_SIZE
+        h, w = min(tile.shape[0], MAPTILE_SIZE), min(tile.shape[1], MAPTILE_SIZE)
+        strip[:, :h, x:x + w] = np.moveaxis(tile[:h, :w], 2, 0)
+        mask[:h, x:x + w] = 255
+    window = Window(0, (row - r0) * MAPTILE_SIZE, n_cols * MAPTILE_SIZE, MAPTILE_SIZE)
+    dst.write(strip, window=window)
+    dst.write_mask(mask, window=window)
+
+
+@profiled(counts=None)
+def build_cog(maptiles_dir, output_path, zoomLevel=1, workers=None, compress="JPEG", quality=90):
+    """
+    Build a georeferenced Cloud-Optimized GeoTIFF (EPSG:32633) from the downloaded atlas
+    map tiles, replacing the ungeoreferenced `merged_tiles.vrt`.
+
+    The tiles are decoded in parallel one tile row at a time and written as strips into
+    a tiled intermediate GeoTIFF, so memory stays bounded by a single strip whatever
+    the size of the mosaic. Missing tiles are masked out. Internal overviews are built
+    on the intermediate file and copied into the final COG layout.
+    Returns `output_path`, or None if there are no tiles.
+    """
+    tiles = scan_maptiles(maptiles_dir)
+    if not tiles:
+        print(f"⚠️ No map tiles found in {maptiles_dir}")
+        return None
+
+    rows = [row for row, _ in tiles]
+    cols = [col for _, col in tiles]
+    r0, c0 = min(rows), min(cols)
+    n_rows, n_cols = max(rows) - r0 + 1, max(cols) - c0 + 1
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp.tif"
+    profile = {
+        "driver": "GTiff",
+        "width": n_cols * MAPTILE_SIZE,
+        "height": n_rows * MAPTILE_SIZE,
+        "count": 3,
+        "dtype": "uint8",
+        "crs": ATLAS_CRS,
+        "transform": maptile_transform(r0, c0, zoomLevel),
+        "tiled": True,
+        "blockxsize": COG_BLOCKSIZE,
+        "blockysize": COG_BLOCKSIZE,
+        "compress": "DEFLATE",
+        "photometric": "RGB",
+    }
+    with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+        with rasterio.open(tmp_path, "w", **profile) as dst, ThreadPoolExecutor(max_workers=workers) as executor:
+            for row in range(r0, r0 + n_rows):
+                write_strip(dst, tiles, row, r0, c0, n_cols, executor)
+            factors = [f for f in COG_OVERVIEWS if max(profile["width"], profile["height"]) // f >= COG_BLOCKSIZE // 2]
+            dst.build_overviews(factors, Resampling.average)
+            dst.update_tags(ns="rio_overview", resampling="average")
+
+        options = {"compress": compress, "blocksize": COG_BLOCKSIZE, "overviews": "FORCE_USE_EXISTING"}
+        if compress.upper() == "JPEG":
+            options["quality"] = quality
+        rasterio.shutil.copy(tmp_path, output_path, driver="COG", **options)
+    os.remove(tmp_path)
+
+    print(f"✅ COG created: {output_path} ({len(tiles)} tiles, {n_cols * MAPTILE_SIZE}x{n_rows * MAPTILE_SIZE} px)")
+    return output_path
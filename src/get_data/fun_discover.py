@@ -0,0 +1,87 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from src.get_data.fun_download import make_session
+
+# 8-neighbourhood, so diagonal tiles along ragged coastlines are still reached
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def probe_url(session, url, timeout=10):
+    """
+    Check whether a URL exists without downloading it: send a HEAD request and fall
+    back to a one-byte range GET for servers that do not allow HEAD.
+    """
+    response = session.head(url, timeout=timeout, allow_redirects=True)
+    if response.status_code in (405, 501):
+        with session.get(url, headers={"Range": "bytes=0-0"}, timeout=timeout, stream=True) as response:
+            pass
+    return response.status_code in (200, 206)
+
+
+def discover_tiles(url_for, seeds=((0, 0),), max_rows=64, max_cols=64, max_workers=8, session=None):
+    """
+    Find the tiles of a sparse grid by walking outward from known tiles.
+
+    `url_for(row, col)` returns the URL of a tile. Starting from `seeds`, every existing
+    tile's neighbours are probed in concurrent waves until no new tiles turn up, so only
+    the tiles on and next to the occupied area are ever requested.
+    Returns a sorted list of `(row, col)` tuples.
+    """
+    if session is None:
+        session = make_session(pool_size=max_workers)
+
+    def in_grid(tile):
+        return 0 <= tile[0] < max_rows and 0 <= tile[1] < max_cols
+
+    found = set()
+    probed = set()
+    frontier = {tuple(tile) for tile in seeds if in_grid(tuple(tile))}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while frontier:
+            wave = sorted(frontier)
+            probed.update(wave)
+            exists = executor.map(lambda tile: probe_url(session, url_for(*tile)), wave)
+            frontier = set()
+            for (row, col), ok in zip(wave, exists):
+                if not ok:
+                    continue
+                found.add((row, col))
+                for d_row, d_col in NEIGHBOURS:
+                    neighbour = (row + d_row, col + d_col)
+                    if in_grid(neighbour) and neighbour not in probed:
+                        frontier.add(neighbour)
+    print(f"🔎 Discovered {len(found)} tiles after {len(probed)} probes")
+    return sorted(found)
+
+
+def load_tile_index(index_path, key):
+    """Return the cached list of `(row, col)` tiles for `key`, or None if not cached."""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as file:
+        tiles = json.load(file).get(key)
+    return None if tiles is None else [tuple(tile) for tile in tiles]
+
+
+def save_tile_index(index_path, key, tiles):
+    """Store the discovered tiles for `key`, keeping the entries of other levels."""
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as file:
+            index = json.load(file)
+    index[key] = [list(tile) for tile in tiles]
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    with open(index_path, "w", encoding="utf-8") as file:
+        json.dump(index, file, indent=1, sort_keys=True)
+
+
+def cached_tile_index(index_path, key, url_for, refresh=False, **kwargs):
+    """Load the tile index for `key` from the cache, discovering and storing it on a miss."""
+    tiles = None if refresh else load_tile_index(index_path, key)
+    if tiles is None:
+        tiles = discover_tiles(url_for, **kwargs)
+        if tiles:
+            save_tile_index(index_path, key, tiles)
+    return tiles
@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.fun_cache import file_sha256
+from src.get_data.fun_manifest import (
+    STATUS_MISSING,
+    STATUS_OK,
+    STATUS_PARTIAL,
+    get_entry,
+    is_current,
+    load_manifest,
+    mark_checked,
+    save_manifest,
+)
+
+# HTTP status codes worth retrying (rate limiting and transient server errors)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def make_session(pool_size=16):
+    """Create a keep-alive session with a connection pool sized for `pool_size` workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Return the module-wide shared session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def fetch_file(session, file_url, save_path, timeout=10, retries=3, backoff=0.5, entry=None):
+    """
+    Download a single file, retrying transient failures (connection errors, timeouts,
+    truncated transfers, RETRY_STATUS responses) with exponential backoff.
+    The body is streamed to `<save_path>.part` and moved into place once complete,
+    so an interrupted download is resumed with a Range request on the next attempt.
+    If a manifest `entry` is given, an unchanged file is revalidated with a conditional
+    request and the entry is updated in place.
+    Returns `(status, nbytes)` where status is "downloaded", "unchanged" or "missing".
+    """
+    part_path = save_path + ".part"
+    for attempt in range(retries + 1):
+        headers = {}
+        if entry is not None and is_current(entry, save_path):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and not headers:
+            headers["Range"] = f"bytes={offset}-"
+            if entry is not None and entry.get("etag"):
+                headers["If-Range"] = entry["etag"]
+        try:
+            with session.get(file_url, headers=headers, timeout=timeout, stream=True) as response:
+                if response.status_code == 304:
+                    if entry is not None:
+                        mark_checked(entry, STATUS_OK)
+                    return "unchanged", 0
+                if response.status_code == 404:
+                    if entry is not None:
+                        mark_checked(entry, STATUS_MISSING)
+                    return "missing", 0
+                if response.status_code == 416:
+                    # Stale .part file that no longer fits the remote file: start over
+                    os.remove(part_path)
+                    continue
+                if response.status_code in RETRY_STATUS and attempt < retries:
+                    raise requests.ConnectionError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+
+                os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+                mode = "ab" if response.status_code == 206 else "wb"
+                nbytes = 0
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(1 << 16):
+                        file.write(chunk)
+                        nbytes += len(chunk)
+                os.replace(part_path, save_path)
+                if entry is not None:
+                    mark_checked(
+                        entry,
+                        STATUS_OK,
+                        size=os.path.getsize(save_path),
+                        sha256=file_sha256(save_path),
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+                return "downloaded", nbytes
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if entry is not None and os.path.exists(part_path):
+                mark_checked(entry, STATUS_PARTIAL)
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+    raise requests.HTTPError(f"Could not restart download of {file_url}")
+
+
+def download_files(jobs, max_workers=8, timeout=10, retries=3, backoff=0.5, session=None,
+                   manifest_path=None, revalidate=True, retry_missing=False):
+    """
+    Download `(file_url, save_path)` jobs concurrently over one shared keep-alive session.
+    At most `max_workers` requests are in flight at a time.
+
+    With `manifest_path`, every file's URL, size, hash, ETag/Last-Modified and status is
+    recorded in a JSON manifest. Reruns then send conditional requests, resume partial
+    files and skip known 404s (unless `retry_missing`). With `revalidate=False`, files
+    whose size still matches the manifest are trusted without contacting the server.
+
+    Returns a dict of throughput statistics for the run; `stats["paths"]` lists the
+    save paths that are present and up to date afterwards.
+    """
+    jobs = list(jobs)
+    if session is None:
+        session = make_session(pool_size=max_workers)
+    manifest = load_manifest(manifest_path) if manifest_path else None
+
+    stats = {"requested": len(jobs), "downloaded": 0, "unchanged": 0, "missing": 0,
+             "failed": 0, "bytes": 0, "paths": []}
+    start = time.perf_counter()
+    pending = []
+    for url, path in jobs:
+        entry = get_entry(manifest, manifest_path, url, path) if manifest is not None else None
+        if entry is not None and entry.get("status") == STATUS_MISSING and not retry_missing:
+            stats["missing"] += 1
+        elif entry is not None and not revalidate and is_current(entry, path):
+            stats["unchanged"] += 1
+            stats["paths"].append(path)
+        else:
+            pending.append((url, path, entry))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_file, session, url, path, timeout, retries, backoff, entry): (url, path)
+                for url, path, entry in pending
+            }
+            for future in as_completed(futures):
+                url, path = futures[future]
+                try:
+                    status, nbytes = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"⚠️ Failed to download {url}: {e}")
+                    continue
+                stats[status] += 1
+                stats["bytes"] += nbytes
+                if status == "missing":
+                    print(f"❌ Skipped: not found at {url}")
+                else:
+                    stats["paths"].append(path)
+                    if status == "downloaded":
+                        print(f"✅ Downloaded: {url}")
+    finally:
+        if manifest is not None:
+            save_manifest(manifest, manifest_path)
+
+    stats["seconds"] = time.perf_counter() - start
+    print_download_stats(stats)
+    return stats
+
+
+def print_download_stats(stats):
+    """Print a one-line summary of a download run."""
+    seconds = max(stats["seconds"], 1e-9)
+    print(
+        f"📊 {stats['downloaded']}/{stats['requested']} files downloaded, {stats.get('unchanged', 0)} unchanged, "
+        f"{stats.get('missing', 0)} missing, {stats['failed']} failed, "
+        f"{stats['bytes'] / 1e6:.2f} MB in {stats['seconds']:.2f}s "
+        f"({stats['downloaded'] / seconds:.1f} files/s, {stats['bytes'] / 1e6 / seconds:.2f} MB/s)"
+    )
@@ -1,12 +1,23 @@
 import os
-import re
-import requests
+import numpy as np
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Polygon
+import shapely
 import shapely.wkt
-import re
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from src.fun_join import join_tables
+from src.fun_profile import profiled
+from src.get_data.fun_discover import cached_tile_index
+from src.get_data.fun_download import download_files, fetch_file, get_session
+from src.get_data.fun_scan import AREA_RECORD, iter_records, scan_attributes
+from src.get_data.fun_tile_cache import (
+    cached_parse,
+    read_attribute_frame,
+    read_tile_arrays,
+    write_attribute_frame,
+    write_tile_arrays,
+)
 
 # Define global parameters
 g_rwUL = (-456230.500963895, 6402413.07213028)  # upper-left UTM
@@ -37,84 +48,201 @@ def px2rw_point_with_offset(pxPt, row, col, zoomLevel):
     Y_UTM = g_rwUL[1] - px2rw(pxY, zoomLevel) - row * row_offset
     return (X_UTM, Y_UTM)
 
+def px2rw_array_with_offset(pxPts, row, col, zoomLevel):
+    """Vectorized `px2rw_point_with_offset` for an (n, 2) array of pixel coordinates."""
+    pxPts = np.asarray(pxPts, dtype=np.float64)
+    scale = get_scaleFactor(zoomLevel)
+    utm = np.empty_like(pxPts)
+    utm[:, 0] = g_rwUL[0] + pxPts[:, 0] / scale + col * col_offset
+    utm[:, 1] = g_rwUL[1] - pxPts[:, 1] / scale - row * row_offset
+    return utm
+
+AREA_PATTERN = r'coords="([^"]+)" href="javascript:show_popup\((\d+)\);" id="(\d+)_area" title="([^"]+)"'
+
+def parse_js_arrays(filepath, row, col, zoomLevel):
+    """
+    Parse a GEOTILES .JS file into flat arrays: an (n, 2) array of UTM coordinates,
+    ring offsets into it (ring i is coords[offsets[i]:offsets[i + 1]]), and the
+    region id and name of each ring. Rings with fewer than 3 points are dropped.
+    """
+    coords_strs, counts, region_ids, region_names = [], [], [], []
+    for coords_str, region_id, _, region_name in iter_records(filepath, AREA_RECORD):
+        n_values = coords_str.count(b",") + 1
+        if n_values >= 6:
+            coords_strs.append(coords_str)
+            counts.append(n_values // 2)
+            region_ids.append(int(region_id))
+            region_names.append(region_name.decode("utf-8"))
+    if not coords_strs:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64), []
+
+    px = np.array(b",".join(coords_strs).split(b","), dtype=np.int64).reshape(-1, 2)
+    counts = np.array(counts, dtype=np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = px2rw_array_with_offset(px, row, col, zoomLevel)
+    return coords, offsets, np.array(region_ids, dtype=np.int64), list(region_names)
+
+def rings_to_polygons(coords, offsets):
+    """Build one shapely Polygon per ring in a single bulk call."""
+    if len(offsets) < 2:
+        return np.empty(0, dtype=object)
+    ring_index = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return shapely.polygons(shapely.linearrings(coords, indices=ring_index))
+
 def parse_js_file(filepath, row, col, zoomLevel):
-    polygons = []
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-        matches = re.findall(r'coords="([^"]+)" href="javascript:show_popup\((\d+)\);" id="(\d+)_area" title="([^"]+)"', content)
-        for coords_str, region_id, _, region_name in matches:
-            coord_list = list(map(int, coords_str.split(",")))
-            points_utm = []
-            for i in range(0, len(coord_list), 2):
-                x_local = coord_list[i]
-                y_local = coord_list[i + 1]
-                X_UTM, Y_UTM = px2rw_point_with_offset((x_local, y_local), row, col, zoomLevel)
-                points_utm.append((X_UTM, Y_UTM))
-            if len(points_utm) >= 3:
-                polygons.append({
-                    "geometry": Polygon(points_utm),
-                    "region_id": int(region_id),
-                    "region_name": region_name
-                })
-    return polygons
-
-def build_geodata(tiles_dir, zoomLevel):
-    all_polygons = []
+    coords, offsets, region_ids, region_names = parse_js_arrays(filepath, row, col, zoomLevel)
+    geometries = rings_to_polygons(coords, offsets)
+    return [
+        {"geometry": geometry, "region_id": int(region_id), "region_name": region_name}
+        for geometry, region_id, region_name in zip(geometries, region_ids, region_names)
+    ]
+
+def list_tiles(tiles_dir):
+    """Return `(row, col, path)` for every .JS tile in a directory, in row/column order."""
+    tiles = []
     for filename in os.listdir(tiles_dir):
         if filename.endswith(".JS"):
             row, col = map(int, filename.replace(".JS", "").split("_"))
-            file_path = os.path.join(tiles_dir, filename)
-            all_polygons.extend(parse_js_file(file_path, row, col, zoomLevel))
-    return gpd.GeoDataFrame(all_polygons, geometry="geometry", crs="EPSG:32633")
+            tiles.append((row, col, os.path.join(tiles_dir, filename)))
+    return sorted(tiles)
+
+def transform_key(row, col, zoomLevel):
+    """Everything besides the file content that determines a tile's parsed coordinates."""
+    return (zoomLevel, row, col, g_rwUL, g_rwLR, tuple(g_baseMapExt), tuple(g_zoomFactors),
+            row_offset, col_offset)
 
-def download_js_file(file_url, save_path):
+def parse_tile(task):
+    """
+    Process-pool entry point: parse one `(row, col, path, zoomLevel, use_cache)` task
+    into arrays, going through the per-tile cache if `use_cache` is set.
+    """
+    row, col, file_path, zoomLevel, use_cache = task
+    if not use_cache:
+        return parse_js_arrays(file_path, row, col, zoomLevel)
+    return cached_parse(
+        file_path,
+        transform_key(row, col, zoomLevel),
+        lambda: parse_js_arrays(file_path, row, col, zoomLevel),
+        read_tile_arrays,
+        write_tile_arrays,
+    )
+
+@profiled()
+def build_geodata(tiles_dir, zoomLevel, workers=None, use_cache=False):
+    """
+    Parse every tile of a zoom level into one GeoDataFrame (EPSG:32633).
+    With `workers` > 1 the tiles are parsed in a process pool; workers send back plain
+    coordinate/offset/id arrays and the polygons are built once in the parent, so the
+    row order is the same (tiles in row/column order) whatever the worker count.
+    With `use_cache`, each tile's parsed arrays are stored in `<tiles_dir>/.cache`,
+    keyed by file hash, zoom level and transform constants, and only new or changed
+    tiles are reparsed.
+    """
+    tasks = [(row, col, path, zoomLevel, use_cache) for row, col, path in list_tiles(tiles_dir)]
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            parsed = list(executor.map(parse_tile, tasks, chunksize=chunksize))
+    else:
+        parsed = [parse_tile(task) for task in tasks]
+
+    coords, offsets, region_ids, region_names = [np.empty((0, 2))], [np.zeros(1, dtype=np.int64)], [], []
+    n_points = 0
+    for tile_coords, tile_offsets, ids, names in parsed:
+        coords.append(tile_coords)
+        offsets.append(tile_offsets[1:] + n_points)
+        n_points += len(tile_coords)
+        region_ids.append(ids)
+        region_names.extend(names)
+    return gpd.GeoDataFrame(
+        {
+            "geometry": rings_to_polygons(np.concatenate(coords), np.concatenate(offsets)),
+            "region_id": np.concatenate(region_ids) if region_ids else np.empty(0, dtype=np.int64),
+            "region_name": region_names,
+        },
+        geometry="geometry",
+        crs="EPSG:32633",
+    )
+
+def download_js_file(file_url, save_path, session=None):
     try:
-        response = requests.get(file_url, timeout=10)
-        response.raise_for_status()
-        with open(save_path, "wb") as file:
-            file.write(response.content)
+        status, _ = fetch_file(session or get_session(), file_url, save_path)
+        if status == "missing":
+            raise FileNotFoundError("404 Not Found")
         print(f"✅ Downloaded: {file_url}")
     except Exception as e:
         print(f"⚠️ Failed to download {file_url}: {e}")
 
-def download_geotiles(base_url, output_dir, zoom_levels, num_tiles_x, num_tiles_y):
+@profiled(counts=None)
+def download_geotiles(base_url, output_dir, zoom_levels, num_tiles_x, num_tiles_y, max_workers=8,
+                      manifest_path=None, discover=False, refresh_index=False):
+    """
+    Download the GEOTILES of each zoom level. With `discover=True` the occupied tiles are
+    found by probing outward from tile 0_0 (within `num_tiles_x` × `num_tiles_y`), and the
+    index is cached in `<output_dir>/tile_index.json` so later runs fetch only real tiles.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    jobs = []
     for zoom_level in zoom_levels:
         tile_dir = f"TILES_{zoom_level}"
         dir_url = f"{base_url}/{tile_dir}"
         local_dir = os.path.join(output_dir, tile_dir)
         os.makedirs(local_dir, exist_ok=True)
-        for row in range(num_tiles_y):
-            for col in range(num_tiles_x):
-                tile_file = f"{row}_{col}.JS"
-                tile_url = f"{dir_url}/{tile_file}"
-                save_path = os.path.join(local_dir, tile_file)
-                download_js_file(tile_url, save_path)
-
-def parse_attributes(attributes_dir):
-    all_attributes = []
-    for filename in os.listdir(attributes_dir):
-        if filename.endswith(".JS"):
-            file_path = os.path.join(attributes_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as file:
-                js_content = file.read()
-                matches = re.findall(r'add_content\((\d+),"(.*?)"\)', js_content)
-                for match in matches:
-                    region_id = int(match[0])
-                    data = match[1].split(",")
-                    parsed_data = {}
-                    for item in data:
-                        if "||" in item:
-                            key, value = item.split("||", 1)
-                            parsed_data[key.strip()] = value.strip()
-                    parsed_data["region_id"] = region_id
-                    all_attributes.append(parsed_data)
-    return pd.DataFrame(all_attributes)
-
+        if discover:
+            tiles = cached_tile_index(
+                os.path.join(output_dir, "tile_index.json"),
+                tile_dir,
+                lambda row, col: f"{dir_url}/{row}_{col}.JS",
+                refresh=refresh_index,
+                max_rows=num_tiles_y,
+                max_cols=num_tiles_x,
+                max_workers=max_workers,
+            )
+        else:
+            tiles = [(row, col) for row in range(num_tiles_y) for col in range(num_tiles_x)]
+        for row, col in tiles:
+            tile_file = f"{row}_{col}.JS"
+            tile_url = f"{dir_url}/{tile_file}"
+            save_path = os.path.join(local_dir, tile_file)
+            jobs.append((tile_url, save_path))
+    return download_files(jobs, max_workers=max_workers, manifest_path=manifest_path)
+
+@profiled()
+def parse_attributes(attributes_dir, use_cache=False):
+    """
+    Parse all ATTRIBUTES .JS files into one table keyed by `region_id`.
+    With `use_cache`, each file's table is cached in `<attributes_dir>/.cache` by content
+    hash and only new or changed files are rescanned.
+    """
+    file_paths = [
+        os.path.join(attributes_dir, filename)
+        for filename in os.listdir(attributes_dir)
+        if filename.endswith(".JS")
+    ]
+    if not use_cache:
+        return scan_attributes(file_paths)
+
+    frames = [
+        cached_parse(
+            file_path,
+            "attributes",
+            lambda file_path=file_path: scan_attributes([file_path]),
+            read_attribute_frame,
+            write_attribute_frame,
+        )
+        for file_path in file_paths
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+@profiled()
 def merge_and_save_enriched_map(stitched_gdf, attributes_df, output_path):
     if not stitched_gdf.empty and not attributes_df.empty:
         # Merge the GeoDataFrame and attributes DataFrame
-        enriched_gdf = stitched_gdf.merge(attributes_df, on="region_id", how="left")
+        enriched_gdf = join_tables(stitched_gdf, [(attributes_df, "region_id", "region_id")])
         
         # Clean column names
         enriched_gdf.columns = (
@@ -181,94 +309,53 @@ def generate_possible_filenames():
     filenames += [f"C000000{i}.JPG" for i in range(10, 13)]
     return filenames
 
-def download_images():
-    """Download images and save them with unique filenames."""
+def maptile_folder(row):
+    """Subfolder of a map tile row, e.g. row 10 -> R0000000A (8-digit upper-case hex)."""
+    return f"R{row:08X}"
+
+def maptile_filename(col):
+    """Image filename of a map tile column, e.g. column 16 -> C00000010.JPG."""
+    return f"C{col:08X}.JPG"
+
+@profiled(counts=lambda files: {"files": len(files)})
+def download_images(maptiles_base_url, output_directory, manifest_path=None, max_workers=8,
+                    discover=False, refresh_index=False):
+    """
+    Download images and save them with unique filenames.
+    With `discover=True` only the tiles found by probing outward from R00000000/C00000000
+    are requested, and the index is cached per level in `<output_directory>/tile_index.json`.
+    """
     subfolders = generate_possible_folders()
     filenames = generate_possible_filenames()
-    downloaded_files = []
-
-    for subfolder in subfolders:
-        for filename in filenames:
-            image_url = f"{maptiles_base_url}/{subfolder}/{filename}"
-            # Create a unique filename combining folder and file names
-            unique_filename = f"{subfolder}_{filename}"
-            save_path = os.path.join(output_directory, unique_filename)
-
-            try:
-                response = requests.get(image_url, stream=True)
-                if response.status_code == 200:
-                    with open(save_path, "wb") as file:
-                        for chunk in response.iter_content(1024):
-                            file.write(chunk)
-                    print(f"✅ Downloaded {filename} as {unique_filename}")
-                    downloaded_files.append((subfolder, filename, save_path))
-                else:
-                    print(f"❌ Skipped {filename}: Not found at {image_url}.")
-            except Exception as e:
-                print(f"⚠️ Error downloading {filename}: {e}")
-
+    os.makedirs(output_directory, exist_ok=True)
+
+    if discover:
+        level = maptiles_base_url.rstrip("/").rsplit("/", 1)[-1]
+        tiles = cached_tile_index(
+            os.path.join(output_directory, "tile_index.json"),
+            level,
+            lambda row, col: f"{maptiles_base_url}/{maptile_folder(row)}/{maptile_filename(col)}",
+            refresh=refresh_index,
+            max_rows=len(subfolders),
+            max_cols=len(filenames),
+            max_workers=max_workers,
+        )
+        grid = [(maptile_folder(row), maptile_filename(col)) for row, col in tiles]
+    else:
+        grid = [(subfolder, filename) for subfolder in subfolders for filename in filenames]
+
+    jobs = []
+    tiles = {}
+    for subfolder, filename in grid:
+        image_url = f"{maptiles_base_url}/{subfolder}/{filename}"
+        # Create a unique filename combining folder and file names
+        unique_filename = f"{subfolder}_{filename}"
+        save_path = os.path.join(output_directory, unique_filename)
+        jobs.append((image_url, save_path))
+        tiles[save_path] = (subfolder, filename, save_path)
+
+    stats = download_files(jobs, max_workers=max_workers, manifest_path=manifest_path)
+    # Keep the grid order of the old serial loop
+    present = set(stats["paths"])
+    downloaded_files = [tile for path, tile in tiles.items() if path in present]
     return downloaded_files
-
-def generate_vrt(downloaded_files):
-    """Generate a Virtual Raster (.vrt) that correctly positions all downloaded tiles."""
-    vrt_path = os.path.join(output_directory, "merged_tiles.vrt")
-    vrt_root = ET.Element("VRTDataset")
-
-    # Tile dimensions (adjust if needed)
-    tile_width, tile_height = 256, 256
-    min_row, max_row = float("inf"), float("-inf")
-    min_col, max_col = float("inf"), float("-inf")
-
-    tile_info = []
-    # Regex to capture one or more hexadecimal characters from both folder and filename parts
-    pattern = r"R0000000([A-F0-9]+)_C0000000([A-F0-9]+)\.JPG"
-
-    for subfolder, filename, file_path in downloaded_files:
-        combined_name = f"{subfolder}_{filename}"
-        match = re.search(pattern, combined_name)
-        if match:
-            # Interpret the captured groups as hexadecimal values
-            row = int(match.group(1), 16)
-            col = int(match.group(2), 16)
-            min_row = min(min_row, row)
-            max_row = max(max_row, row)
-            min_col = min(min_col, col)
-            max_col = max(max_col, col)
-            # Use basename so that the VRT can refer to the image relative to its location
-            tile_info.append((row, col, os.path.basename(file_path)))
-        else:
-            print(f"❌ Failed to parse filename: {combined_name}")
-
-    if not tile_info:
-        print("No valid tiles found. Exiting VRT generation.")
-        return None
-
-    # Calculate overall raster dimensions based on the grid of tiles
-    raster_width = (max_col - min_col + 1) * tile_width
-    raster_height = (max_row - min_row + 1) * tile_height
-    vrt_root.set("rasterXSize", str(raster_width))
-    vrt_root.set("rasterYSize", str(raster_height))
-
-    # Create a VRT with three bands (assuming the JPEG images are in RGB)
-    for band in range(1, 4):  # Bands 1 (Red), 2 (Green), 3 (Blue)
-        raster_band = ET.SubElement(vrt_root, "VRTRasterBand", dataType="Byte", band=str(band))
-        for row, col, filename in tile_info:
-            simple_source = ET.SubElement(raster_band, "SimpleSource")
-            ET.SubElement(simple_source, "SourceFilename", relativeToVRT="1").text = filename
-            ET.SubElement(simple_source, "SourceBand").text = str(band)
-            # Define the source rectangle covering the entire tile
-            ET.SubElement(simple_source, "SrcRect", xOff="0", yOff="0",
-                          xSize=str(tile_width), ySize=str(tile_height))
-            # Calculate destination offsets relative to the minimum row and col
-            x_offset = (col - min_col) * tile_width
-            y_offset = (row - min_row) * tile_height
-            ET.SubElement(simple_source, "DstRect", xOff=str(x_offset), yOff=str(y_offset),
-                          xSize=str(tile_width), ySize=str(tile_height))
-
-    # Write the VRT XML to file
-    vrt_data = ET.tostring(vrt_root, encoding="utf-8").decode()
-    with open(vrt_path, "w") as vrt_file:
-        vrt_file.write(vrt_data)
-
-    print(f"✅ VRT file created: {vrt_path}")
-    return vrt_path
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+
+# Entry status values
+STATUS_OK = "ok"
+STATUS_MISSING = "missing"  # server answered 404
+STATUS_PARTIAL = "partial"  # interrupted download, a .part file is on disk
+
+
+def load_manifest(manifest_path):
+    """Load a download manifest, or return an empty one if it does not exist yet."""
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    return {"files": {}}
+
+
+def save_manifest(manifest, manifest_path):
+    """Write the manifest atomically so an interrupted run never leaves it truncated."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_key(manifest_path, save_path):
+    """Key files by their path relative to the manifest, with forward slashes."""
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    return os.path.relpath(os.path.abspath(save_path), root).replace(os.sep, "/")
+
+
+def get_entry(manifest, manifest_path, file_url, save_path):
+    """Return the (mutable) manifest entry for a file, creating it if needed."""
+    key = manifest_key(manifest_path, save_path)
+    entry = manifest["files"].setdefault(key, {})
+    if entry.get("url") != file_url:
+        entry.clear()
+        entry["url"] = file_url
+    return entry
+
+
+def is_current(entry, save_path):
+    """True if the file on disk matches the size recorded in its manifest entry."""
+    return (
+        entry.get("status") == STATUS_OK
+        and os.path.exists(save_path)
+        and os.path.getsize(save_path) == entry.get("size")
+    )
+
+
+def mark_checked(entry, status, **fields):
+    """Update an entry with a new status and any response metadata."""
+    entry.update(fields)
+    entry["status"] = status
+    entry["checked"] = time.strftime("%Y-%m-%dT%H:%M:%S")
@@ -0,0 +1,65 @@
+import os
+import re
+import mmap
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Byte-level versions of the GEOTILES and ATTRIBUTES record patterns
+AREA_RECORD = re.compile(
+    rb'coords="([^"]+)" href="javascript:show_popup\((\d+)\);" id="(\d+)_area" title="([^"]+)"'
+)
+ATTRIBUTE_RECORD = re.compile(rb'add_content\((\d+),"(.*?)"\)')
+
+
+def iter_records(filepath, pattern):
+    """
+    Lazily yield the group tuples (as bytes) of every `pattern` match in a file.
+    The file is memory-mapped, so it is never copied into one big string.
+    """
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for match in pattern.finditer(mm):
+                yield match.groups()
+
+
+def scan_attributes(file_paths):
+    """
+    Scan ATTRIBUTES .JS files into a DataFrame with one row per `add_content` record.
+
+    Values go straight into per-column buffers instead of one dict per record. Column
+    order, NaN for missing keys and the split on "," then "||" are the same as building
+    `pd.DataFrame` from a list of dicts, as `parse_attributes` used to do.
+    """
+    columns = {}
+    region_ids = array("q")
+    n_rows = 0
+    for file_path in file_paths:
+        for region_id, payload in iter_records(file_path, ATTRIBUTE_RECORD):
+            for item in payload.decode("utf-8").split(","):
+                if "||" in item:
+                    key, value = item.split("||", 1)
+                    key = key.strip()
+                    buffer = columns.get(key)
+                    if buffer is None:
+                        buffer = columns[key] = [np.nan] * n_rows
+                    if len(buffer) > n_rows:
+                        buffer[n_rows] = value.strip()  # repeated key: last one wins
+                    else:
+                        buffer.append(value.strip())
+            if n_rows == 0:
+                columns.setdefault("region_id", None)
+            region_ids.append(int(region_id))
+            n_rows += 1
+            for buffer in columns.values():
+                if buffer is not None and len(buffer) < n_rows:
+                    buffer.append(np.nan)
+
+    data = {
+        key: np.frombuffer(region_ids, dtype=np.int64).copy() if buffer is None else buffer
+        for key, buffer in columns.items()
+    }
+    return pd.DataFrame(data)
@@ -0,0 +1,87 @@
+import os
+import glob
+import hashlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.fun_cache import file_sha256
+
+# Bump when the parsers change, so old cache files are no longer picked up
+CACHE_VERSION = 1
+
+
+def cache_path(file_path, key_parts, cache_dir=None):
+    """
+    Path of the cached parse of `file_path`, keyed by the file's content hash and
+    `key_parts` (e.g. zoom level and transform constants). Defaults to a `.cache`
+    folder next to the file.
+    """
+    digest = hashlib.sha256(
+        f"{CACHE_VERSION}|{file_sha256(file_path)}|{key_parts!r}".encode("utf-8")
+    ).hexdigest()[:16]
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(file_path), ".cache")
+    return os.path.join(cache_dir, f"{os.path.basename(file_path)}.{digest}.parquet")
+
+
+def write_cache(path, table):
+    """Write a Parquet cache file atomically and drop stale entries for the same source file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    source_name = os.path.basename(path).rsplit(".", 2)[0]
+    for stale in glob.glob(os.path.join(glob.escape(os.path.dirname(path)), f"{glob.escape(source_name)}.*.parquet")):
+        os.remove(stale)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_tile_arrays(path, coords, offsets, region_ids, region_names):
+    """Cache parsed tile rings as one Parquet row per ring with list-typed x/y columns."""
+    offsets = pa.array(offsets, type=pa.int32())
+    table = pa.table({
+        "region_id": pa.array(region_ids, type=pa.int64()),
+        "region_name": pa.array(region_names, type=pa.string()),
+        "x": pa.ListArray.from_arrays(offsets, pa.array(coords[:, 0], type=pa.float64())),
+        "y": pa.ListArray.from_arrays(offsets, pa.array(coords[:, 1], type=pa.float64())),
+    })
+    write_cache(path, table)
+
+
+def read_tile_arrays(path):
+    """Inverse of `write_tile_arrays`: return `(coords, offsets, region_ids, region_names)`."""
+    table = pq.read_table(path)
+    x = table.column("x").combine_chunks()
+    y = table.column("y").combine_chunks()
+    offsets = x.offsets.to_numpy().astype(np.int64)
+    coords = np.column_stack([x.values.to_numpy(), y.values.to_numpy()])
+    region_ids = table.column("region_id").to_numpy().astype(np.int64)
+    return coords, offsets, region_ids, table.column("region_name").to_pylist()
+
+
+def write_attribute_frame(path, df):
+    """Cache a parsed ATTRIBUTES table."""
+    write_cache(path, pa.Table.from_pandas(df, preserve_index=False))
+
+
+def read_attribute_frame(path):
+    """Read a cached ATTRIBUTES table, restoring NaN (not None) for missing values."""
+    df = pq.read_table(path).to_pandas()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+def cached_parse(file_path, key_parts, parse, read, write, cache_dir=None):
+    """Return `read(cache)` on a cache hit, otherwise `parse()` and store the result with `write`."""
+    path = cache_path(file_path, key_parts, cache_dir)
+    if os.path.exists(path):
+        return read(path)
+    result = parse()
+    if isinstance(result, tuple):
+        write(path, *result)
+    else:
+        write(path, result)
+    return result
@@ -0,0 +1,253 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from src.fun_profile import profiled
+
+
+def quantize_rings(geometries, grid_size, translate):
+    """
+    Flatten (multi)polygons into quantized rings.
+    Returns the integer coordinates of all open rings (closing point dropped), the ring
+    offsets into them, and for each ring its polygon index and whether it is a shell;
+    and for each polygon its feature index.
+    """
+    polygons, feature_index = shapely.get_parts(geometries, return_index=True)
+    rings, polygon_index = shapely.get_rings(polygons, return_index=True)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    q = np.round((coords - translate) / grid_size).astype(np.int64)
+
+    # Drop the closing point and any vertices that collapsed onto their predecessor
+    last = np.r_[ring_index[1:] != ring_index[:-1], True]
+    keep = ~last
+    keep[1:] &= (q[1:] != q[:-1]).any(axis=1) | (ring_index[1:] != ring_index[:-1])
+    q, ring_index = q[keep], ring_index[keep]
+
+    # Rings with fewer than 3 distinct points vanish, and so do polygons that lose their shell
+    counts = np.bincount(ring_index, minlength=len(rings))
+    is_shell = np.r_[True, polygon_index[1:] != polygon_index[:-1]]
+    lost_shell = np.zeros(len(polygons), dtype=bool)
+    lost_shell[polygon_index[is_shell & (counts < 3)]] = True
+    ring_ok = (counts >= 3) & ~lost_shell[polygon_index]
+    q = q[ring_ok[ring_index]]
+    offsets = np.r_[0, np.cumsum(counts[ring_ok])]
+    return q, offsets, polygon_index[ring_ok], is_shell[ring_ok], feature_index
+
+
+def find_junctions(point_ids, offsets):
+    """
+    Mark the points where rings meet or part: a point is a junction if it is visited
+    with more than one distinct pair of neighbours.
+    """
+    n = len(point_ids)
+    starts = np.repeat(offsets[:-1], np.diff(offsets))
+    ends = np.repeat(offsets[1:], np.diff(offsets))
+    position = np.arange(n)
+    prev_pos = np.where(position == starts, ends - 1, position - 1)
+    next_pos = np.where(position == ends - 1, starts, position + 1)
+    prev_ids, next_ids = point_ids[prev_pos], point_ids[next_pos]
+    visits = np.unique(
+        np.column_stack([point_ids, np.minimum(prev_ids, next_ids), np.maximum(prev_ids, next_ids)]),
+        axis=0,
+    )
+    return np.bincount(visits[:, 0], minlength=point_ids.max() + 1 if n else 0) > 1
+
+
+@profiled(counts=lambda topology: {"arcs": len(topology["arcs"])})
+def build_topology(gdf, grid_size=0.001, object_name="polities"):
+    """
+    Convert a polygon GeoDataFrame into a TopoJSON topology in which every border
+    shared by neighbouring polygons is stored once as an arc and referenced by both.
+    Coordinates are quantized to `grid_size` CRS units and delta-encoded.
+    """
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    translate = gdf.total_bounds[:2]
+    q, offsets, polygon_index, is_shell, feature_index = quantize_rings(geometries, grid_size, translate)
+    points, point_ids = np.unique(q, axis=0, return_inverse=True)
+    point_ids = point_ids.ravel()
+    junction = find_junctions(point_ids, offsets)
+
+    arc_lookup, arcs = {}, []
+
+    def reference(ids):
+        forward, backward = tuple(ids), tuple(ids[::-1])
+        if forward in arc_lookup:
+            return arc_lookup[forward]
+        if backward in arc_lookup:
+            return ~arc_lookup[backward]
+        arc_lookup[forward] = len(arcs)
+        arcs.append(ids)
+        return arc_lookup[forward]
+
+    ring_arcs = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        ring = point_ids[start:end]
+        cuts = np.flatnonzero(junction[ring])
+        if len(cuts) == 0:
+            # A ring that touches no other ring: one closed arc, rotated to a canonical start
+            forward = np.roll(ring, -int(np.argmin(ring)))
+            backward = np.roll(ring[::-1], -int(np.argmin(ring[::-1])))
+            if tuple(backward) < tuple(forward):
+                ring_arcs.append([~reference(np.r_[backward, backward[0]])])
+            else:
+                ring_arcs.append([reference(np.r_[forward, forward[0]])])
+            continue
+        ring = np.roll(ring, -int(cuts[0]))
+        cuts = np.r_[cuts - cuts[0], len(ring)]
+        ring = np.r_[ring, ring[0]]
+        ring_arcs.append([reference(ring[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])])
+
+    # Group rings into polygons and polygons into features
+    polygon_rings = {}
+    for rings_of_polygon, polygon in zip(ring_arcs, polygon_index):
+        polygon_rings.setdefault(polygon, []).append(rings_of_polygon)
+    feature_polygons = {}
+    for polygon, rings in polygon_rings.items():
+        feature_polygons.setdefault(feature_index[polygon], []).append(rings)
+
+    properties = gdf.drop(columns=gdf.geometry.name)
+    records = properties.astype(object).where(properties.notna(), None).to_dict("records")
+    if properties.columns.empty:
+        records = [{} for _ in range(len(gdf))]
+    features = []
+    for i, record in enumerate(records):
+        polygons = feature_polygons.get(i)
+        record = {key: value.item() if isinstance(value, np.generic) else value for key, value in record.items()}
+        if polygons is None:
+            features.append({"type": None, "properties": record})
+        elif shapely.get_type_id(geometries[i]) == 3:
+            features.append({"type": "Polygon", "arcs": polygons[0], "properties": record})
+        else:
+            features.append({"type": "MultiPolygon", "arcs": polygons, "properties": record})
+
+    encoded = []
+    for ids in arcs:
+        xy = points[ids]
+        encoded.append(np.vstack([xy[:1], np.diff(xy, axis=0)]).tolist())
+
+    return {
+        "type": "Topology",
+        "crs": gdf.crs.to_string() if gdf.crs else None,
+        "transform": {"scale": [grid_size, grid_size], "translate": [float(translate[0]), float(translate[1])]},
+        "arcs": encoded,
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": features}},
+    }
+
+
+def decode_arcs(topology):
+    """Decode the delta-encoded arcs into one (n, 2) coordinate array plus arc offsets."""
+    lengths = np.array([len(arc) for arc in topology["arcs"]], dtype=np.int64)
+    offsets = np.r_[0, np.cumsum(lengths)]
+    if offsets[-1] == 0:
+        return np.empty((0, 2)), offsets
+    deltas = np.array([xy for arc in topology["arcs"] for xy in arc], dtype=np.int64)
+    totals = np.cumsum(deltas, axis=0)
+    base = np.vstack([[0, 0], totals[offsets[1:-1] - 1]])
+    absolute = totals - np.repeat(base, lengths, axis=0)
+    scale = np.asarray(topology["transform"]["scale"], dtype=np.float64)
+    translate = np.asarray(topology["transform"]["translate"], dtype=np.float64)
+    return absolute * scale + translate, offsets
+
+
+def encode_arcs(coords, offsets, grid_size, translate):
+    """Quantize and delta-encode arcs given as coordinates plus offsets."""
+    encoded = []
+    q = np.round((coords - translate) / grid_size).astype(np.int64)
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        xy = q[start:end]
+        encoded.append(np.vstack([xy[:1], np.diff(xy, axis=0)]).tolist())
+    return encoded
+
+
+def arc_positions(refs, offsets):
+    """Coordinate positions of a ring made of arc references (joined without repeated points)."""
+    pieces = []
+    for k, ref in enumerate(refs):
+        arc = ref if ref >= 0 else ~ref
+        positions = np.arange(offsets[arc], offsets[arc + 1])
+        if ref < 0:
+            positions = positions[::-1]
+        pieces.append(positions if k == 0 else positions[1:])
+    return np.concatenate(pieces)
+
+
+def topology_to_geodataframe(topology, object_name="polities"):
+    """Rebuild a GeoDataFrame from a topology, assembling all rings with bulk constructors."""
+    coords, offsets = decode_arcs(topology)
+    features = topology["objects"][object_name]["geometries"]
+
+    positions, ring_index, polygon_index, geometry_index = [], [], [], []
+    n_rings = n_polygons = 0
+    for i, feature in enumerate(features):
+        if feature.get("type") is None:
+            continue
+        polygons = [feature["arcs"]] if feature["type"] == "Polygon" else feature["arcs"]
+        for rings in polygons:
+            for refs in rings:
+                ring = arc_positions(refs, offsets)
+                positions.append(ring)
+                ring_index.append(np.full(len(ring), n_rings))
+                polygon_index.append(n_polygons)
+                n_rings += 1
+            geometry_index.append(i)
+            n_polygons += 1
+
+    geometries = np.full(len(features), None, dtype=object)
+    if n_rings:
+        rings = shapely.linearrings(coords[np.concatenate(positions)], indices=np.concatenate(ring_index))
+        polygons = shapely.polygons(rings, indices=np.asarray(polygon_index))
+        geometry_index = np.asarray(geometry_index)
+        multi = shapely.multipolygons(polygons, indices=geometry_index)
+        present = np.unique(geometry_index)
+        geometries[present] = multi[present]
+        single = np.array([features[i]["type"] == "Polygon" for i in present], dtype=bool)
+        geometries[present[single]] = shapely.get_geometry(multi[present[single]], 0)
+
+    properties = pd.DataFrame([feature.get("properties") or {} for feature in features])
+    return gpd.GeoDataFrame(properties, geometry=geometries, crs=topology.get("crs"))
+
+
+def simplify_topology(topology, tolerance):
+    """
+    Simplify every arc once with Douglas-Peucker. Arc endpoints (the junctions) never
+    move and each shared border is simplified a single time, so neighbouring polygons
+    stay edge-consistent. Closed arcs that would collapse are kept as they are.
+    At coarse tolerances separate arcs can still cross; repair those with `make_valid`.
+    """
+    coords, offsets = decode_arcs(topology)
+    lengths = np.diff(offsets)
+    lines = shapely.linestrings(coords, indices=np.repeat(np.arange(len(lengths)), lengths))
+    simplified = shapely.simplify(lines, tolerance, preserve_topology=True)
+    closed = shapely.is_closed(lines)
+    collapsed = closed & (shapely.get_num_coordinates(simplified) < 4)
+    simplified[collapsed] = lines[collapsed]
+    new_coords, arc_index = shapely.get_coordinates(simplified, return_index=True)
+    new_offsets = np.r_[0, np.cumsum(np.bincount(arc_index, minlength=len(lines)))]
+
+    scale = topology["transform"]["scale"][0]
+    translate = np.asarray(topology["transform"]["translate"], dtype=np.float64)
+    return dict(topology, arcs=encode_arcs(new_coords, new_offsets, scale, translate))
+
+
+def open_topojson(path, mode):
+    """Open a TopoJSON file as text, gzip-compressed if `path` ends in `.gz`."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+@profiled(counts=None)
+def write_topojson(topology, path):
+    """Write a topology as compact TopoJSON (gzip-compressed for a `.gz` path)."""
+    with open_topojson(path, "w") as file:
+        json.dump(topology, file, separators=(",", ":"))
+
+
+def read_topojson(path, object_name="polities"):
+    """Load a TopoJSON file written by `write_topojson` back into a GeoDataFrame."""
+    with open_topojson(path, "r") as file:
+        return topology_to_geodataframe(json.load(file), object_name)
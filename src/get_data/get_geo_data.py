@@ -1,15 +1,17 @@
+from src.get_data.fun_download import download_files
 from src.get_data.fun_get_data import (
     download_geotiles, 
-    download_js_file,
     parse_attributes, 
     build_geodata, 
     merge_and_save_enriched_map,
-    round_geometry,
 )
+from src.fun_profile import profile_stage
+from src.get_data.fun_stitch import stitch_tiles
+from src.get_data.fun_topology import build_topology, write_topojson
+from src.plot_maps.fun_basemap import add_basemap
 import os
 import geopandas as gpd
 import matplotlib.pyplot as plt
-import contextily as ctx
 
 # Base URLs and directories
 geotiles_base_url = "https://www.atlas-europa.de/t02/konfessionen/Konfessionen/GEOTILES_0"
@@ -17,68 +19,85 @@ attributes_base_url = "https://www.atlas-europa.de/t02/konfessionen/Konfessionen
 geotiles_output_dir = "../../data/hre/digital_atlas/geotiles"
 attributes_output_dir = "../../data/hre/digital_atlas/attributes"
 enriched_shapefile_path = "../../data/hre/digital_atlas/map/enriched_map.shp"
+enriched_topojson_path = "../../data/hre/digital_atlas/map/enriched_map.topojson.gz"
+manifest_path = "../../data/hre/digital_atlas/manifest.json"
 
-# Download GEOTILES
-download_geotiles(
-    base_url=geotiles_base_url,
-    output_dir=geotiles_output_dir,
-    zoom_levels=[1],  # Adjust zoom levels as needed
-    num_tiles_x=10,
-    num_tiles_y=10
-)
 
-# Download ATTRIBUTES
-attribute_files = [f"{i}.JS" for i in range(40)]
-for file_name in attribute_files:
-    file_url = f"{attributes_base_url}/{file_name}"
-    save_path = os.path.join(attributes_output_dir, file_name)
-    download_js_file(file_url, save_path)
-
-# Parse ATTRIBUTES
-attributes_df = parse_attributes(attributes_output_dir)
-
-# Build GeoDataFrame from GEOTILES
-tiles_directory = f"{geotiles_output_dir}/TILES_1"  # Update for the correct zoom level
-stitched_gdf = build_geodata(tiles_directory, zoomLevel=1)
-
-# Merge and save enriched map
-enriched_gdf = merge_and_save_enriched_map(
-    stitched_gdf=stitched_gdf,
-    attributes_df=attributes_df,
-    output_path=enriched_shapefile_path
-)
+def download_atlas_geodata(geotiles_output_dir=geotiles_output_dir, attributes_output_dir=attributes_output_dir,
+                           manifest_path=manifest_path):
+    """Download the atlas GEOTILES and ATTRIBUTES (incremental, see the download manifest)."""
+    # Download GEOTILES
+    download_geotiles(
+        base_url=geotiles_base_url,
+        output_dir=geotiles_output_dir,
+        zoom_levels=[1],  # Adjust zoom levels as needed
+        num_tiles_x=10,
+        num_tiles_y=10,
+        max_workers=8,
+        discover=True,
+        manifest_path=manifest_path
+    )
 
-# Additional geometry cleaning:
-# 1. Fix geometries with a zero-width buffer
-enriched_gdf['geometry'] = enriched_gdf['geometry'].buffer(0)
-
-# 2. Round geometries to reduce floating-point discrepancies
-enriched_gdf['geometry'] = enriched_gdf['geometry'].apply(round_geometry)
-    
-# 3. Dissolve the geometries by region_id to merge adjacent parts
-dissolved_gdf = enriched_gdf.dissolve(by="region_id")
-    
-# 4. Snap edges with a small positive then negative buffer
-dissolved_gdf['geometry'] = dissolved_gdf['geometry'].buffer(0.01).buffer(-0.01)
-dissolved_gdf = dissolved_gdf.dissolve(by="region_id")
-
-# 5. Further simplify the geometries to remove residual vertical/horizontal lines
-dissolved_gdf['geometry'] = dissolved_gdf['geometry'].simplify(tolerance=1.0, preserve_topology=True)
-dissolved_gdf = dissolved_gdf.dissolve(by="region_id")
-
-# Save the cleaned GeoDataFrame to file
-dissolved_gdf.to_file(enriched_shapefile_path)
-print(f"✅ Enriched map saved as Shapefile at {enriched_shapefile_path}")
-
-# Plot the enriched map with OpenStreetMap basemap
-import matplotlib.pyplot as plt
-import contextily as ctx
-
-fig, ax = plt.subplots(figsize=(12, 12))
-dissolved_gdf.boundary.plot(ax=ax, color="black", linewidth=0.5)
-ctx.add_basemap(ax, crs=dissolved_gdf.crs.to_string(), source=ctx.providers.OpenStreetMap.Mapnik)
-ax.set_title("Enriched Map with OpenStreetMap Basemap")
-plt.xlabel("UTM Easting")
-plt.ylabel("UTM Northing")
-plt.grid(True)
-plt.show()
+    # Download ATTRIBUTES
+    attribute_files = [f"{i}.JS" for i in range(40)]
+    download_files(
+        [(f"{attributes_base_url}/{file_name}", os.path.join(attributes_output_dir, file_name))
+         for file_name in attribute_files],
+        max_workers=8,
+        manifest_path=manifest_path
+    )
+
+
+def build_enriched_map(geotiles_output_dir=geotiles_output_dir, attributes_output_dir=attributes_output_dir,
+                       enriched_shapefile_path=enriched_shapefile_path, enriched_topojson_path=enriched_topojson_path):
+    """Build the enriched atlas map from the downloaded tiles and save it as Shapefile and TopoJSON."""
+    # Parse ATTRIBUTES
+    attributes_df = parse_attributes(attributes_output_dir, use_cache=True)
+
+    # Build GeoDataFrame from GEOTILES
+    tiles_directory = f"{geotiles_output_dir}/TILES_1"  # Update for the correct zoom level
+    stitched_gdf = build_geodata(tiles_directory, zoomLevel=1, workers=os.cpu_count(), use_cache=True)
+
+    # Merge and save enriched map
+    enriched_gdf = merge_and_save_enriched_map(
+        stitched_gdf=stitched_gdf,
+        attributes_df=attributes_df,
+        output_path=enriched_shapefile_path
+    )
+
+    # Stitch the polygons split at tile seams back together: repair invalid pieces,
+    # snap to a 1 mm grid, union seam pieces per region_id and simplify once
+    dissolved_gdf = stitch_tiles(enriched_gdf, zoomLevel=1, grid_size=0.001, simplify_tolerance=1.0)
+
+    # Save the cleaned GeoDataFrame to file
+    with profile_stage("write_shapefile", data=dissolved_gdf):
+        dissolved_gdf.to_file(enriched_shapefile_path)
+    print(f"✅ Enriched map saved as Shapefile at {enriched_shapefile_path}")
+
+    # Also store the map as a compressed topology: shared borders are stored once as arcs,
+    # quantized to 10 cm (well below the 1 m simplification tolerance)
+    write_topojson(build_topology(dissolved_gdf.reset_index(), grid_size=0.1), enriched_topojson_path)
+    print(f"✅ Enriched map topology saved as TopoJSON at {enriched_topojson_path}")
+    return dissolved_gdf
+
+
+def plot_enriched_map(dissolved_gdf):
+    """Plot the enriched map with OpenStreetMap basemap (local tile store, see fun_basemap)."""
+    fig, ax = plt.subplots(figsize=(12, 12))
+    dissolved_gdf.boundary.plot(ax=ax, color="black", linewidth=0.5)
+    add_basemap(ax, crs=dissolved_gdf.crs.to_string())
+    ax.set_title("Enriched Map with OpenStreetMap Basemap")
+    plt.xlabel("UTM Easting")
+    plt.ylabel("UTM Northing")
+    plt.grid(True)
+    plt.show()
+
+
+def main():
+    download_atlas_geodata()
+    plot_enriched_map(build_enriched_map())
+
+
+# Guard the run so process-pool workers can import this module without re-running it
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,38 @@
 import os
-import requests
-import re
-import xml.etree.ElementTree as ET
 
-from fun_get_data import(
-    download_images,
-    generate_possible_folders,
-    generate_possible_filenames,
-    generate_vrt
-)
+from src.get_data.fun_cog import build_cog
+from src.get_data.fun_get_data import download_images
+from src.plot_maps.fun_basemap import seed_project_basemap
 
 # Base URL for downloading tiles
 maptiles_base_url = "https://www.atlas-europa.de/t02/konfessionen/Konfessionen/MAPTILEIMAGES_0/L01"
 
 # Output directory for storing downloaded images
 output_directory = "../../data/hre/digital_atlas/maptiles"
-os.makedirs(output_directory, exist_ok=True)
+manifest_path = "../../data/hre/digital_atlas/manifest.json"
+cog_path = "../../bld/maps/georeferenced_map.tif"
 
-# 🔹 Run the full process
-downloaded_files = download_images()
-vrt_file = generate_vrt(downloaded_files)
 
-print("\n🎯 All tiles downloaded and Virtual Raster created. Load the `.vrt` in QGIS!")
+def download_maptiles(output_directory=output_directory, manifest_path=manifest_path):
+    """Download the atlas map tile images (incremental, see the download manifest)."""
+    os.makedirs(output_directory, exist_ok=True)
+    return download_images(
+        maptiles_base_url, output_directory, manifest_path=manifest_path, discover=True
+    )
+
+
+def main():
+    # 🔹 Run the full process
+    download_maptiles()
+
+    # Georeferenced, tiled and compressed mosaic with overviews (EPSG:32633)
+    cog_file = build_cog(output_directory, cog_path)
+
+    # Seed the local OpenStreetMap tile store for the atlas extent, so maps render offline
+    seed_project_basemap()
+
+    print(f"\n🎯 All tiles downloaded and georeferenced. Load {cog_file} in QGIS!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import matplotlib
+import pandas as pd
+import geopandas as gpd
+
+from src.fun_cache import cache_key, cached_files_sha256, file_sha256
+from src.fun_profile import profile_stage, profiling_enabled, take_records, write_report
+from src.data_management import data_manage
+from src.data_management.fun_boundaries import load_national_boundary
+from src.data_management.fun_ingest import load_election_panel, read_religion_data
+from src.data_management.fun_manage import load_geodata
+from src.get_data.fun_cog import build_cog
+from src.get_data.get_geo_data import build_enriched_map, download_atlas_geodata
+from src.get_data.get_image_data import download_maptiles
+from src.plot_maps.fun import merge_data_religion
+from src.plot_maps.fun_basemap import seed_project_basemap
+from src.plot_maps.plot import plot_comparison_maps, render_single_maps
+from src.plot_maps.serve_tiles import export_tiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def path(relative):
+    """Absolute path of a path relative to the repository root."""
+    return os.path.join(ROOT, *relative.split("/"))
+
+
+# ----------------------------------------------------------------------
+# File paths (sources, intermediate tables and products)
+# ----------------------------------------------------------------------
+geotiles_dir = path("data/hre/digital_atlas/geotiles")
+attributes_dir = path("data/hre/digital_atlas/attributes")
+maptiles_dir = path("data/hre/digital_atlas/maptiles")
+manifest_path = path("data/hre/digital_atlas/manifest.json")
+enriched_filepath = path("data/hre/digital_atlas/map/enriched_map.shp")
+enriched_topojson_path = path("data/hre/digital_atlas/map/enriched_map.topojson.gz")
+hre_filepath = path("data/hre/digital_atlas/maptiles/WHRE.shp")
+geo_filepath = path("data/shapefiles/vg250_ebenen_1231/DE_VG250.gpkg")
+religion_filepath = path("data/zensus/religion.xlsx")
+national_rds_path = path("data/election/federal_muni_harm.rds")
+basemap_store = path("data/basemap/osm_mapnik.mbtiles")
+
+state_dir = path("bld/.cache/pipeline")
+religion_table = os.path.join(state_dir, "religion.parquet")
+election_table = os.path.join(state_dir, "election_panel.parquet")
+municipalities_table = os.path.join(state_dir, "municipalities.parquet")
+
+data_folder = path("bld/data")
+maps_folder = path("bld/maps")
+cog_path = path("bld/maps/georeferenced_map.tif")
+mbtiles_path = path("bld/tiles/religion_voting.mbtiles")
+
+
+# ----------------------------------------------------------------------
+# Stages that are not a single script function
+# ----------------------------------------------------------------------
+def download_atlas(geotiles_dir, attributes_dir, maptiles_dir, manifest_path):
+    """All atlas downloads. They share one download manifest, so they run in a single stage."""
+    download_atlas_geodata(geotiles_dir, attributes_dir, manifest_path)
+    download_maptiles(maptiles_dir, manifest_path)
+
+
+def write_table(df, output_path):
+    """Write a (Geo)DataFrame as (Geo)Parquet, atomically."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+
+
+def load_religion_table(religion_filepath, output_path):
+    write_table(read_religion_data(religion_filepath), output_path)
+
+
+def load_election_table(national_rds_path, output_path):
+    write_table(
+        load_election_panel(national_rds_path, columns=data_manage.election_columns, years=data_manage.election_years),
+        output_path,
+    )
+
+
+def load_municipalities_table(geo_filepath, output_path):
+    write_table(load_geodata(geo_filepath), output_path)
+
+
+def merge_datasets(religion_table, election_table, municipalities_table, geo_filepath, hre_filepath,
+                   enriched_filepath, output_folder):
+    data_manage.build_merged_dataset(
+        pd.read_parquet(religion_table),
+        pd.read_parquet(election_table),
+        gpd.read_parquet(municipalities_table),
+        geo_filepath=geo_filepath,
+        hre_filepath=hre_filepath,
+        enriched_filepath=enriched_filepath,
+        output_folder=output_folder,
+    )
+
+
+def load_map_data(municipalities_table, religion_table):
+    return merge_data_religion(gpd.read_parquet(municipalities_table), pd.read_parquet(religion_table))
+
+
+def comparison_maps(municipalities_table, religion_table, enriched_filepath, geo_filepath, output_folder):
+    plot_comparison_maps(
+        load_map_data(municipalities_table, religion_table),
+        gpd.read_file(enriched_filepath),
+        load_national_boundary(geo_filepath),
+        output_folder,
+    )
+
+
+def single_maps(municipalities_table, religion_table, output_folder):
+    render_single_maps(load_map_data(municipalities_table, religion_table), output_folder)
+
+
+# ----------------------------------------------------------------------
+# Task graph
+# ----------------------------------------------------------------------
+# Every stage calls `run(**inputs, **outputs, **params)`. A stage depends on the stages
+# producing its inputs (a path or a folder containing it). `products` lists the files
+# a stage writes into a folder shared with other stages. `after` orders a stage after
+# others without fingerprinting their output, e.g. a shared store it also writes to.
+STAGES = [
+    {"name": "atlas_download", "run": download_atlas,
+     "outputs": {"geotiles_dir": geotiles_dir, "attributes_dir": attributes_dir,
+                 "maptiles_dir": maptiles_dir, "manifest_path": manifest_path}},
+    {"name": "basemap", "run": seed_project_basemap,
+     "outputs": {"store_path": basemap_store}},
+    {"name": "zensus", "run": load_religion_table,
+     "inputs": {"religion_filepath": religion_filepath},
+     "outputs": {"output_path": religion_table}},
+    {"name": "election", "run": load_election_table,
+     "inputs": {"national_rds_path": national_rds_path},
+     "outputs": {"output_path": election_table}},
+    {"name": "vg250", "run": load_municipalities_table,
+     "inputs": {"geo_filepath": geo_filepath},
+     "outputs": {"output_path": municipalities_table}},
+    {"name": "atlas_map", "run": build_enriched_map,
+     "inputs": {"geotiles_output_dir": geotiles_dir, "attributes_output_dir": attributes_dir},
+     "outputs": {"enriched_shapefile_path": enriched_filepath, "enriched_topojson_path": enriched_topojson_path}},
+    {"name": "atlas_mosaic", "run": build_cog,
+     "inputs": {"maptiles_dir": maptiles_dir},
+     "outputs": {"output_path": cog_path}},
+    {"name": "merge", "run": merge_datasets,
+     "inputs": {"religion_table": religion_table, "election_table": election_table,
+                "municipalities_table": municipalities_table, "geo_filepath": geo_filepath,
+                "hre_filepath": hre_filepath, "enriched_filepath": enriched_filepath},
+     "outputs": {"output_folder": data_folder},
+     "products": [os.path.join(data_folder, "merged_national_with_signed_distance.gpkg"),
+                  os.path.join(data_folder, "polity_border_distances.parquet")]},
+    # The HRE comparison draws the OSM basemap from basemap_store, which it also updates
+    # (new tiles, access times), so it runs after seeding rather than next to it
+    {"name": "comparison_maps", "run": comparison_maps,
+     "inputs": {"municipalities_table": municipalities_table, "religion_table": religion_table,
+                "enriched_filepath": enriched_filepath, "geo_filepath": geo_filepath},
+     "after": ["basemap"],
+     "outputs": {"output_folder": maps_folder},
+     "products": [os.path.join(maps_folder, filename) for filename in [
+         "religion_maps_side_by_side.png", "hre_comparison_unique_colors_fixed.png", "catholic_hre_overlay.png"]]},
+    {"name": "single_maps", "run": single_maps,
+     "inputs": {"municipalities_table": municipalities_table, "religion_table": religion_table},
+     "outputs": {"output_folder": maps_folder},
+     "products": [os.path.join(maps_folder, f"{column}_{region}.png")
+                  for column in ["catholic", "protestant", "none"] for region in ["germany", "west_germany"]]},
+    {"name": "vector_tiles", "run": export_tiles,
+     "inputs": {"merged_filepath": os.path.join(data_folder, "merged_national_with_signed_distance.gpkg"),
+                "enriched_filepath": enriched_filepath},
+     "outputs": {"mbtiles_path": mbtiles_path}},
+]
+
+
+def produces(stage, filepath):
+    """True if `filepath` is one of the stage's outputs or products, or lies in an output folder."""
+    for output in list(stage.get("outputs", {}).values()) + stage.get("products", []):
+        if filepath == output or filepath.startswith(output + os.sep):
+            return True
+    return False
+
+
+def stage_dependencies(stages):
+    """`{stage name: set of stage names it depends on}`."""
+    dependencies = {}
+    for stage in stages:
+        dependencies[stage["name"]] = {
+            other["name"] for other in stages
+            if other is not stage
+            and (other["name"] in stage.get("after", [])
+                 or any(produces(other, filepath) for filepath in stage.get("inputs", {}).values()))
+        }
+    return dependencies
+
+
+def select_stages(stages, targets=None):
+    """Names of the `targets` and every stage they depend on (all stages if no targets)."""
+    dependencies = stage_dependencies(stages)
+    if not targets:
+        return set(dependencies)
+    unknown = set(targets) - set(dependencies)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}; choose from {sorted(dependencies)}")
+    selected, pending = set(), list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies[name])
+    return selected
+
+
+# ----------------------------------------------------------------------
+# Fingerprints: inputs, parameters and code
+# ----------------------------------------------------------------------
+def sidecar_files(filepath):
+    """A file plus the files sharing its name with another extension (e.g. a Shapefile's .dbf, .shx, .prj)."""
+    stem, _ = os.path.splitext(filepath)
+    folder = os.path.dirname(filepath)
+    return sorted(
+        os.path.join(folder, filename) for filename in os.listdir(folder)
+        if os.path.splitext(os.path.join(folder, filename))[0] == stem
+    )
+
+
+def input_digest(filepath, cache_dir):
+    """Content hash of an input file (with its sidecar files) or of all files in an input folder."""
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Missing pipeline input: {filepath}")
+    if os.path.isdir(filepath):
+        files = []
+        for folder, subfolders, filenames in os.walk(filepath):
+            # Hidden folders hold caches (.cache)
+            subfolders[:] = sorted(name for name in subfolders if not name.startswith("."))
+            files.extend(os.path.join(folder, filename) for filename in sorted(filenames))
+    else:
+        files = sidecar_files(filepath)
+    digests = cached_files_sha256(files, cache_dir)
+    return cache_key(*[(os.path.relpath(file, filepath), digest) for file, digest in zip(files, digests)])
+
+
+def code_digest(func):
+    """
+    Hash of the code behind a stage: the source of `func` and of the pipeline helpers it
+    calls, plus every `src` module they use, transitively. Editing one plot function thus
+    reruns only the stages that depend on it.
+    """
+    sources, modules = [], {}
+    pending, seen = [func], set()
+    while pending:
+        value = pending.pop()
+        if inspect.isfunction(value) and value.__globals__ is globals():
+            if value not in seen:
+                seen.add(value)
+                sources.append(inspect.getsource(value))
+                pending.extend(globals()[name] for name in value.__code__.co_names if name in globals())
+            continue
+        name = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+        if isinstance(name, str) and name.startswith("src.") and name not in modules and name in sys.modules:
+            modules[name] = sys.modules[name]
+            pending.extend(vars(modules[name]).values())
+    return cache_key(*sources, *[(name, file_sha256(modules[name].__file__)) for name in sorted(modules)])
+
+
+def stage_kwargs(stage):
+    return {**stage.get("inputs", {}), **stage.get("outputs", {}), **stage.get("params", {})}
+
+
+def stage_fingerprint(stage, cache_dir):
+    """Fingerprint of everything a stage's result depends on; unchanged fingerprint means skip."""
+    kwargs = {key: os.path.relpath(value, ROOT) if isinstance(value, str) and value.startswith(ROOT) else value
+              for key, value in stage_kwargs(stage).items()}
+    inputs = {key: input_digest(filepath, cache_dir) for key, filepath in stage.get("inputs", {}).items()}
+    return cache_key(stage["name"], sorted(kwargs.items()), sorted(inputs.items()), code_digest(stage["run"]))
+
+
+def outputs_exist(stage):
+    return all(os.path.exists(filepath) for filepath in
+               list(stage.get("outputs", {}).values()) + stage.get("products", []))
+
+
+def load_state(state_path):
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    return {}
+
+
+def save_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+
+# ----------------------------------------------------------------------
+# Running
+# ----------------------------------------------------------------------
+def init_stage_worker():
+    """Stage workers draw headless: `plt.show()` must not block a batch run."""
+    matplotlib.use("Agg")
+
+
+def run_stage(name, func, kwargs):
+    """Run one stage in a worker; returns its duration and the profile records of the stage."""
+    start = time.perf_counter()
+    with profile_stage(name):
+        func(**kwargs)
+    return time.perf_counter() - start, take_records()
+
+
+def run_pipeline(stages=STAGES, targets=None, force=(), workers=4, dry_run=False, state_dir=state_dir):
+    """
+    Bring the `targets` (all stages if None) up to date. A stage is skipped if its
+    outputs exist and its fingerprint (input file contents, parameters and code) is the
+    one recorded after its last successful run; `force` names stages to rerun anyway
+    ('all' for every stage). Stages whose dependencies are done run concurrently in up to
+    `workers` processes. Returns `{stage name: 'skipped' | 'ran' | 'stale'}`
+    ('stale' only in a dry run).
+    """
+    dependencies = stage_dependencies(stages)
+    selected = select_stages(stages, targets)
+    state_path = os.path.join(state_dir, "state.json")
+    state = load_state(state_path)
+    waiting = [stage for stage in stages if stage["name"] in selected]
+    status, running, errors, records = {}, {}, [], []
+    total = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_stage_worker) as executor:
+        while waiting or running:
+            # Skipped stages unblock their dependents right away, so schedule until nothing changes
+            progress = True
+            while progress and not errors:
+                progress = False
+                for stage in [stage for stage in waiting if dependencies[stage["name"]] <= set(status)]:
+                    waiting.remove(stage)
+                    name = stage["name"]
+                    try:
+                        fingerprint = stage_fingerprint(stage, state_dir)
+                    except FileNotFoundError as error:
+                        # In a dry run, inputs of stale upstream stages may not exist yet
+                        if not dry_run:
+                            print(f"❌ {name}: {error}")
+                            errors.append(error)
+                            break
+                        fingerprint = None
+                    unchanged = (
+                        fingerprint is not None
+                        and name not in force and "all" not in force
+                        and not any(status[dependency] == "stale"
+                                    for dependency in dependencies[name] - set(stage.get("after", [])))
+                        and state.get(name, {}).get("fingerprint") == fingerprint
+                        and outputs_exist(stage)
+                    )
+                    if unchanged:
+                        print(f"⏩ {name}: unchanged, skipped")
+                        status[name] = "skipped"
+                        progress = True
+                    elif dry_run:
+                        print(f"🔹 {name}: would run")
+                        status[name] = "stale"
+                        progress = True
+                    else:
+                        print(f"🔹 {name}: running")
+                        running[executor.submit(run_stage, name, stage["run"], stage_kwargs(stage))] = (stage, fingerprint)
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, fingerprint = running.pop(future)
+                name = stage["name"]
+                try:
+                    seconds, stage_records = future.result()
+                except Exception as error:
+                    print(f"❌ {name} failed: {error!r}")
+                    errors.append(error)
+                    continue
+                if not outputs_exist(stage):
+                    print(f"⚠️ {name} finished without writing all of its outputs")
+                state[name] = {"fingerprint": fingerprint, "seconds": round(seconds, 2),
+                               "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                save_state(state, state_path)
+                status[name] = "ran"
+                records.extend(stage_records)
+                print(f"✅ {name} done in {seconds:.1f}s")
+
+    if profiling_enabled():
+        write_report(records)
+    if errors:
+        print(f"🛑 Pipeline stopped after {len(errors)} failed stage(s)")
+        raise errors[0]
+    ran = sum(value == "ran" for value in status.values())
+    print(f"📊 {ran} stage(s) run, {len(status) - ran} skipped or stale in {time.perf_counter() - total:.1f}s")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.pipeline",
+        description="Run the data pipeline. Stages whose inputs, parameters and code are unchanged are skipped; "
+                    "independent stages run concurrently.",
+    )
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date, with the stages they depend on (default: all)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="rerun STAGE even if it is unchanged (repeatable; 'all' reruns every stage)")
+    parser.add_argument("--workers", type=int, default=4, help="maximum number of stages running at once")
+    parser.add_argument("--dry-run", action="store_true", help="only report which stages would run")
+    parser.add_argument("--list", action="store_true", help="list the stages and their dependencies")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, dependencies in stage_dependencies(STAGES).items():
+            print(f"{name}: {', '.join(sorted(dependencies)) or '-'}")
+        return
+    run_pipeline(STAGES, args.targets, args.force, args.workers, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
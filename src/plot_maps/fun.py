@@ -1,56 +1,43 @@
 import numpy as np
 import geopandas as gpd
-import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-from matplotlib.colors import ListedColormap
+from matplotlib.colors import ListedColormap, to_rgba_array
 import seaborn as sns
-import contextily as ctx
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import os
 
+from src.data_management.fun_ingest import read_religion_data
+from src.fun_join import join_tables
+from src.fun_profile import profiled
+from src.plot_maps.fun_basemap import add_project_basemap
+from src.plot_maps.fun_clip import filtered_clipped_layer
+from src.plot_maps.fun_lod import lod_geometries
+from src.plot_maps.fun_raster import (
+    colorize,
+    draw_raster,
+    label_raster,
+    plot_raster_column,
+    raster_shape,
+    value_colors,
+)
+
 def load_geodata(filepath):
     """Load municipalities from GeoPackage (or any supported file)."""
     gem_data = gpd.read_file(filepath, layer='vg250_gem')
     return gem_data
 
 def load_religion_data(filepath):
-    """Load religion data and keep only necessary columns."""
-    religion_data = pd.read_excel(filepath, sheet_name=0, header=3)
-    column_names = [
-        "Region_Code", "Region_Name", "Population_Type", "Unit", "Total_Population", 
-        "Protestant_e", "Protestant", "Catholic_e", "Catholic", "None_e", "None", "final_e"
-    ]
-    religion_data.columns = column_names
-    religion_data = religion_data.dropna(subset=["Region_Code", "Region_Name"], how='all')
-    
-    # Convert relevant columns to numeric, replacing errors with NaN, then fill with 0
-    religion_data[['Protestant', 'Catholic', 'None']] = (
-        religion_data[['Protestant', 'Catholic', 'None']]
-        .apply(pd.to_numeric, errors='coerce')
-        .fillna(0)
-    )
-    
-    # Drop columns ending with '_e'
-    religion_data = religion_data[[col for col in religion_data.columns if not col.endswith("_e")]]
-
-    # (Optional) Filter for a specific federal state by code, e.g., Thüringen starts with '16'
-    # religion_data = religion_data[religion_data['Region_Code'].str.startswith('16')]
-
-    return religion_data
+    """Load religion data and keep only necessary columns (cached, see `fun_ingest`)."""
+    return read_religion_data(filepath)
 
 def merge_data_religion(geo_data, religion_data):
     """
     Merge GeoDataFrame with religion DataFrame.
     Note: Ensure `Region_Code` aligns with the GeoDataFrame's ID column (e.g., 'SDV_ARS').
+    Codes are matched as integer keys (see `join_tables`).
     """
-    map_data = geo_data.merge(
-        religion_data,
-        left_on='SDV_ARS',
-        right_on='Region_Code',
-        how='left'
-    )
-    return map_data
+    return join_tables(geo_data, [(religion_data, 'SDV_ARS', 'Region_Code')])
 
 def plot_map_religion(
     map_data,
@@ -58,12 +45,21 @@ def plot_map_religion(
     cmap='Reds',
     legend_label='Catholics %',
     output_folder=None,
-    filename='religion_map.png'
+    filename='religion_map.png',
+    render='vector',
+    lod=True
 ):
     """
     Plot the specified religion column on a GeoDataFrame,
     without Eichsfeld or Geisa boundaries.
+    With render='raster', the municipalities are drawn from a cached label raster
+    at the output resolution instead of as polygon patches (see `fun_raster`).
+    With lod=True, the coarsest simplified geometry level that is visually lossless
+    at the figure size and dpi is drawn (see `fun_lod`).
     """
+    dpi = 600
+    if lod:
+        map_data = lod_geometries(map_data, 'municipalities', (12, 8), dpi)
     # Ensure map data is in a consistent CRS (e.g., Web Mercator)
     map_data = map_data.to_crs(epsg=3857)
 
@@ -73,16 +69,19 @@ def plot_map_religion(
 
     # Plotting
     _, ax = plt.subplots(1, 1, figsize=(12, 8))
-    map_data.plot(
-        column=column,
-        cmap=cmap,
-        linewidth=0.0,
-        ax=ax,
-        edgecolor='none',
-        legend=False,
-        vmin=vmin,
-        vmax=vmax
-    )
+    if render == 'raster':
+        plot_raster_column(map_data, column, ax, cmap, vmin, vmax, dpi)
+    else:
+        map_data.plot(
+            column=column,
+            cmap=cmap,
+            linewidth=0.0,
+            ax=ax,
+            edgecolor='none',
+            legend=False,
+            vmin=vmin,
+            vmax=vmax
+        )
 
     # Set zoom based on data extent
     ax.set_xlim(map_data.total_bounds[0], map_data.total_bounds[2])
@@ -106,19 +105,30 @@ def plot_map_religion(
     if output_folder:
         os.makedirs(output_folder, exist_ok=True)
         output_path = os.path.join(output_folder, filename)
-        plt.savefig(output_path, dpi=600, bbox_inches='tight')
+        plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
         print(f"Plot saved to {output_path}")
 
     plt.show()
 
+@profiled(counts=None)
 def plot_religion_maps_side_by_side(
     map_data_religion,
     columns=['Catholic', 'Protestant', 'None'],
     cmaps=['Reds', 'Blues', 'Greys'],
     legend_labels=['Catholics %', 'Protestants %', 'None %'],
     output_folder=None,
-    filename="religion_maps_side_by_side.png"
+    filename="religion_maps_side_by_side.png",
+    render='vector',
+    lod=True
 ):
+    """
+    Plot several religion columns next to each other. With render='raster', the
+    municipalities are rasterized once and every column is a color lookup on that raster.
+    With lod=True, each panel draws the coarsest visually lossless geometry level.
+    """
+    dpi = 300
+    if lod:
+        map_data_religion = lod_geometries(map_data_religion, 'municipalities', (10, 12), dpi)
     map_data_religion = map_data_religion.to_crs(epsg=3857)
 
     fig, axes = plt.subplots(1, 3, figsize=(30, 12))  # Increased figure size
@@ -129,16 +139,19 @@ def plot_religion_maps_side_by_side(
         vmin = map_data_religion[column].quantile(0.05)
         vmax = map_data_religion[column].quantile(0.95)
 
-        map_data_religion.plot(
-            column=column,
-            cmap=cmap,
-            linewidth=0.0,
-            ax=ax,
-            edgecolor='none',
-            legend=False,
-            vmin=vmin,
-            vmax=vmax
-        )
+        if render == 'raster':
+            plot_raster_column(map_data_religion, column, ax, cmap, vmin, vmax, dpi)
+        else:
+            map_data_religion.plot(
+                column=column,
+                cmap=cmap,
+                linewidth=0.0,
+                ax=ax,
+                edgecolor='none',
+                legend=False,
+                vmin=vmin,
+                vmax=vmax
+            )
 
         ax.set_title(f"Distribution of {legend_label}", fontsize=30)  # Larger title
         ax.axis('off')
@@ -156,11 +169,12 @@ def plot_religion_maps_side_by_side(
     if output_folder:
         os.makedirs(output_folder, exist_ok=True)
         output_path = os.path.join(output_folder, filename)
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
         print(f"✅ Plot saved to {output_path}")
 
     plt.show()
 
+@profiled(counts=None)
 def overlay_catholic_regions_on_map(
     map_data_religion,
     enriched_gdf,
@@ -170,26 +184,30 @@ def overlay_catholic_regions_on_map(
     filter_column_konf='Konf',
     filter_value_konf='ka',
     overlay_color='gray',
-    fill_opacity=0.3
+    fill_opacity=0.3,
+    germany_boundary=None,
+    lod=True,
+    output_file=None
 ):
-    enriched_gdf = enriched_gdf.to_crs(map_data_religion.crs)
-
-    filtered_gdf = enriched_gdf[
-        (enriched_gdf[filter_column_geb] == filter_value_geb) &
-        (enriched_gdf[filter_column_konf] == filter_value_konf)
-    ]
-
-    filtered_gdf = filtered_gdf[filtered_gdf.is_valid]
-    germany_boundary = map_data_religion.unary_union
-    clipped_gdf = filtered_gdf.intersection(germany_boundary)
-    clipped_gdf = gpd.GeoDataFrame(geometry=clipped_gdf, crs=map_data_religion.crs)
-    clipped_gdf = clipped_gdf[~clipped_gdf.is_empty]
+    # Only polities crossing the border are intersected; the result is cached per filter
+    clipped_gdf = filtered_clipped_layer(
+        enriched_gdf,
+        {filter_column_geb: filter_value_geb, filter_column_konf: filter_value_konf},
+        map_data_religion,
+        boundary=germany_boundary,
+    )
 
     vmin = map_data_religion[religion_column].quantile(0.05)
     vmax = map_data_religion[religion_column].quantile(0.95)
 
+    # Draw the municipalities at the coarsest level that is visually lossless in the saved file
+    dpi = 300
+    plot_data = map_data_religion
+    if lod:
+        plot_data = lod_geometries(map_data_religion, 'municipalities', (14, 10), dpi)
+
     fig, ax = plt.subplots(figsize=(14, 10))  # Increased figure size
-    map_data_religion.plot(
+    plot_data.plot(
         column=religion_column,
         cmap='Reds',
         linewidth=0.0,
@@ -222,20 +240,37 @@ def overlay_catholic_regions_on_map(
 
     ax.axis('off')
     ax.set_title("Distribution of Catholics overlayed with HRE borders", fontsize=30)  # Larger title
+    if output_file:
+        plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
+        print(f"✅ Plot saved to {output_file}")
     plt.show()
 
+@profiled(counts=None)
 def plot_hre_comparison(
     enriched_gdf, 
     geb_filter='r', 
     konf_column='Konf', 
-    output_file=None
+    output_file=None,
+    render='vector',
+    basemap='osm',
+    lod=True
 ):
+    """
+    Plot the HRE polities in distinct colors next to their confession. With
+    render='raster', the polity fills come from one label raster and only the borders
+    are drawn as lines. `basemap` is 'osm' (local tile store), 'atlas' (the downloaded
+    atlas map tiles) or None, see `fun_basemap`. With lod=True, the polities are
+    drawn at the coarsest visually lossless geometry level.
+    """
+    dpi = 300
     hre_gdf = enriched_gdf[enriched_gdf['Geb'] == geb_filter]
 
     if hre_gdf.empty:
         print("⚠️ No polities found with Geb =", geb_filter)
         return
 
+    if lod:
+        hre_gdf = lod_geometries(hre_gdf, 'polities', (12, 12), dpi)
     hre_gdf = hre_gdf.to_crs(epsg=3857)  
 
     unique_ids = hre_gdf['region_id'].unique()
@@ -246,33 +281,50 @@ def plot_hre_comparison(
 
     fig, axes = plt.subplots(1, 2, figsize=(24, 12))  # Increased figure size
 
-    hre_gdf.plot(
-        color=hre_gdf['region_color'],
-        linewidth=0.5,
-        ax=axes[0],
-        edgecolor='black',
-        legend=False
-    )
-    ctx.add_basemap(axes[0], source=ctx.providers.OpenStreetMap.Mapnik, alpha=0.5)
+    if render == 'raster':
+        width, height = raster_shape(hre_gdf.total_bounds, axes[0], dpi)
+        labels = label_raster(hre_gdf, hre_gdf.total_bounds, width, height)
+        draw_raster(axes[0], colorize(labels, to_rgba_array(hre_gdf['region_color'].tolist())), hre_gdf.total_bounds)
+        hre_gdf.boundary.plot(ax=axes[0], color='black', linewidth=0.5)
+    else:
+        hre_gdf.plot(
+            color=hre_gdf['region_color'],
+            linewidth=0.5,
+            ax=axes[0],
+            edgecolor='black',
+            legend=False
+        )
+    add_project_basemap(axes[0], basemap, alpha=0.5)
     axes[0].set_title("Holy Roman Empire Polities in 1648", fontsize=30)  # Larger title
     axes[0].axis('off')
 
-    hre_gdf.plot(
-        column=konf_column,
-        cmap='tab10',
-        linewidth=0.5,
-        ax=axes[1],
-        edgecolor='black',
-        legend=True
-    )
-    ctx.add_basemap(axes[1], source=ctx.providers.OpenStreetMap.Mapnik, alpha=0.5)
+    if render == 'raster':
+        # Categories in sorted order, colored like geopandas' categorical plots
+        categories, codes = np.unique(hre_gdf[konf_column].astype(str), return_inverse=True)
+        category_colors = value_colors(np.arange(len(categories)), 'tab10', 0, max(len(categories) - 1, 1))
+        draw_raster(axes[1], colorize(labels, category_colors[codes]), hre_gdf.total_bounds)
+        hre_gdf.boundary.plot(ax=axes[1], color='black', linewidth=0.5)
+        axes[1].legend(handles=[
+            Line2D([0], [0], marker='o', color='none', markerfacecolor=color, markersize=10, label=category)
+            for category, color in zip(categories, category_colors)
+        ])
+    else:
+        hre_gdf.plot(
+            column=konf_column,
+            cmap='tab10',
+            linewidth=0.5,
+            ax=axes[1],
+            edgecolor='black',
+            legend=True
+        )
+    add_project_basemap(axes[1], basemap, alpha=0.5)
     axes[1].set_title("Religions in the Empire", fontsize=30)  # Larger title
     axes[1].axis('off')
 
     plt.tight_layout()
 
     if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
         print(f"✅ Plot saved to {output_file}")
 
     plt.show()
\ No newline at end of file
@@ -0,0 +1,374 @@
+import io
+import os
+import glob
+import math
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from pyproj import CRS, Transformer
+
+from src.get_data.fun_download import get_session
+from src.get_data.fun_get_data import g_rwLR, g_rwUL, get_scaleFactor
+
+OSM_MAPNIK = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+# XYZ URL template of the basemap tiles (default: OSM_MAPNIK). Use your own or a
+# commercial tile server for heavy seeding: the OpenStreetMap tile usage policy
+# discourages bulk downloads from tile.openstreetmap.org.
+BASEMAP_SOURCE_ENV = "RELIGION_VOTING_BASEMAP_SOURCE"
+# Project data folders, resolved from the module path so any working directory works
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+BASEMAP_STORE = os.path.join(DATA_DIR, "basemap", "osm_mapnik.mbtiles")
+ATLAS_MAPTILES_DIR = os.path.join(DATA_DIR, "hre", "digital_atlas", "maptiles")
+TILE_SIZE = 256
+WEB_MERCATOR_HALF = 20037508.342789244
+
+# Tile store schema: the standard MBTiles tables plus an access log for LRU eviction
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE TABLE IF NOT EXISTS tile_access (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, last_access REAL, size INTEGER,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS tile_access_time ON tile_access (last_access);
+"""
+
+STORE_LOCK = threading.Lock()
+# Access times of tiles read from each open store, written by `flush_access` in one short transaction
+ACCESS_TIMES = {}
+# Seconds a connection waits for another process' write lock before giving up
+STORE_TIMEOUT = 60
+
+
+def basemap_source(source=None):
+    """`source`, or the tile URL template set in RELIGION_VOTING_BASEMAP_SOURCE, or OSM_MAPNIK."""
+    return source or os.environ.get(BASEMAP_SOURCE_ENV) or OSM_MAPNIK
+
+
+def open_tile_store(store_path, source=OSM_MAPNIK):
+    """Open (or create) an MBTiles/SQLite tile store for one tile source."""
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(store_path, timeout=STORE_TIMEOUT, check_same_thread=False)
+    # WAL lets readers go on while another process writes tiles
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT OR IGNORE INTO metadata VALUES ('name', ?), ('format', ?), ('source', ?)",
+                 (os.path.basename(store_path), source.rsplit(".", 1)[-1], source))
+    conn.commit()
+    stored = conn.execute("SELECT value FROM metadata WHERE name='source'").fetchone()[0]
+    if stored != source:
+        print(f"⚠️ {store_path} holds tiles of {stored}, not {source}; use another store path per source")
+    return conn
+
+
+def flush_access(conn):
+    """Write the access times recorded by `get_tile` in one transaction."""
+    with STORE_LOCK:
+        accessed = ACCESS_TIMES.pop(conn, {})
+        if accessed:
+            conn.executemany(
+                "UPDATE tile_access SET last_access=? WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                [(last_access, z, x, tms_y) for (z, x, tms_y), last_access in accessed.items()],
+            )
+            conn.commit()
+
+
+def close_tile_store(conn):
+    """Write pending access times (see `get_tile`) and close the store."""
+    try:
+        flush_access(conn)
+    finally:
+        conn.close()
+
+
+def get_tile(conn, z, x, y):
+    """
+    Tile bytes for XYZ tile (z, x, y), or None. Rows are stored flipped (TMS), as
+    MBTiles requires. The access time for LRU eviction is only kept in memory here, so
+    reads never hold the write lock; `evict_tiles` and `close_tile_store` write it.
+    """
+    tms_y = (1 << z) - 1 - y
+    with STORE_LOCK:
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", (z, x, tms_y)
+        ).fetchone()
+        if row is not None:
+            ACCESS_TIMES.setdefault(conn, {})[(z, x, tms_y)] = time.time()
+    return None if row is None else row[0]
+
+
+def put_tile(conn, z, x, y, data):
+    """Store the bytes of XYZ tile (z, x, y)."""
+    tms_y = (1 << z) - 1 - y
+    with STORE_LOCK:
+        conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_y, data))
+        conn.execute("INSERT OR REPLACE INTO tile_access VALUES (?, ?, ?, ?, ?)",
+                     (z, x, tms_y, time.time(), len(data)))
+        conn.commit()
+
+
+def evict_tiles(conn, max_bytes):
+    """Drop the least recently used tiles until the store holds at most `max_bytes` of tile data."""
+    flush_access(conn)
+    with STORE_LOCK:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tile_access").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        removed = 0
+        for z, x, y, size in conn.execute(
+            "SELECT zoom_level, tile_column, tile_row, size FROM tile_access ORDER BY last_access"
+        ).fetchall():
+            if total <= max_bytes:
+                break
+            conn.execute("DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", (z, x, y))
+            conn.execute("DELETE FROM tile_access WHERE zoom_level=? AND tile_column=? AND tile_row=?", (z, x, y))
+            total -= size
+            removed += 1
+        conn.commit()
+    print(f"🧹 Evicted {removed} basemap tiles")
+    return removed
+
+
+def tile_range(bounds_3857, z):
+    """XYZ tile columns and rows covering Web Mercator `bounds` at zoom `z`."""
+    minx, miny, maxx, maxy = bounds_3857
+    n = 1 << z
+    span = 2 * WEB_MERCATOR_HALF / n
+    x0 = int(np.clip((minx + WEB_MERCATOR_HALF) // span, 0, n - 1))
+    x1 = int(np.clip((maxx + WEB_MERCATOR_HALF) // span, 0, n - 1))
+    y0 = int(np.clip((WEB_MERCATOR_HALF - maxy) // span, 0, n - 1))
+    y1 = int(np.clip((WEB_MERCATOR_HALF - miny) // span, 0, n - 1))
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def auto_zoom(bounds_3857, width_px, max_zoom=18):
+    """Zoom level at which the extent is about `width_px` pixels wide."""
+    span = max(bounds_3857[2] - bounds_3857[0], 1.0)
+    z = math.log2(2 * WEB_MERCATOR_HALF * width_px / (TILE_SIZE * span))
+    return int(np.clip(round(z), 0, max_zoom))
+
+
+def fetch_tile(source, z, x, y, session=None, timeout=30):
+    """Download one XYZ tile; None if the server has no such tile."""
+    session = session or get_session()
+    response = session.get(source.format(z=z, x=x, y=y), timeout=timeout,
+                           headers={"User-Agent": "religion_voting basemap cache"})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+def cached_tile(conn, source, z, x, y, offline=False):
+    """Tile from the store, downloading and storing it on a miss unless `offline`."""
+    data = get_tile(conn, z, x, y)
+    if data is None and not offline:
+        data = fetch_tile(source, z, x, y)
+        if data is not None:
+            put_tile(conn, z, x, y, data)
+    return data
+
+
+def seed_tiles(store_path, bounds_3857, zooms, source=None, max_workers=1):
+    """
+    Pre-download all tiles of `source` (see `basemap_source`) covering `bounds` at each
+    zoom in `zooms`, so later renders can run offline. Tiles already in the store are
+    skipped. Failed downloads (e.g. HTTP 429) are reported and skipped, not raised,
+    and are retried on the next run. One request at a time by default, as the
+    OpenStreetMap tile usage policy asks; only raise `max_workers` for your own server.
+    Returns the number of tiles stored.
+    """
+    source = basemap_source(source)
+    conn = open_tile_store(store_path, source)
+
+    def fetch(tile):
+        try:
+            return fetch_tile(source, *tile), None
+        except Exception as e:
+            return None, e
+
+    stored, failed = 0, []
+    try:
+        wanted = [(z, x, y) for z in zooms for x in tile_range(bounds_3857, z)[0] for y in tile_range(bounds_3857, z)[1]]
+        missing = [tile for tile in wanted if get_tile(conn, *tile) is None]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for tile, (data, error) in zip(missing, executor.map(fetch, missing)):
+                if error is not None:
+                    failed.append((tile, error))
+                elif data is not None:
+                    put_tile(conn, *tile, data)
+                    stored += 1
+    finally:
+        close_tile_store(conn)
+    print(f"✅ Seeded {stored} of {len(missing)} missing basemap tiles ({len(wanted)} wanted) into {store_path}")
+    if failed:
+        print(f"⚠️ {len(failed)} basemap tiles failed, e.g. {failed[0][0]}: {failed[0][1]}")
+    return stored
+
+
+def basemap_image(conn, bounds_3857, z, source=OSM_MAPNIK, offline=False):
+    """
+    Mosaic of the tiles covering `bounds` at zoom `z` as an RGBA array plus its
+    extent `(minx, maxx, miny, maxy)` in EPSG:3857. Tiles that are unavailable
+    (offline and not cached) are left transparent.
+    """
+    xs, ys = tile_range(bounds_3857, z)
+    image = np.zeros((len(ys) * TILE_SIZE, len(xs) * TILE_SIZE, 4), dtype=np.uint8)
+    for j, y in enumerate(ys):
+        for i, x in enumerate(xs):
+            data = cached_tile(conn, source, z, x, y, offline)
+            if data is not None:
+                tile = Image.open(io.BytesIO(data)).convert("RGBA").resize((TILE_SIZE, TILE_SIZE))
+                image[j * TILE_SIZE:(j + 1) * TILE_SIZE, i * TILE_SIZE:(i + 1) * TILE_SIZE] = np.asarray(tile)
+    span = 2 * WEB_MERCATOR_HALF / (1 << z)
+    extent = (
+        -WEB_MERCATOR_HALF + xs[0] * span, -WEB_MERCATOR_HALF + (xs[-1] + 1) * span,
+        WEB_MERCATOR_HALF - (ys[-1] + 1) * span, WEB_MERCATOR_HALF - ys[0] * span,
+    )
+    return image, extent
+
+
+def add_basemap(ax, store_path=BASEMAP_STORE, source=None, crs="EPSG:3857", zoom="auto",
+                alpha=1.0, offline=None, max_bytes=512 * 1024 ** 2):
+    """
+    Drop-in for `ctx.add_basemap`, served from a local tile store of `source` (see
+    `basemap_source`). Missing tiles are
+    downloaded and kept unless `offline` (default: the RELIGION_VOTING_OFFLINE
+    environment variable), in which case only stored tiles are used. The store is
+    then trimmed to `max_bytes` by evicting the least recently used tiles. On axes in
+    another CRS than EPSG:3857 the mosaic is warped with rasterio.
+    """
+    if offline is None:
+        offline = os.environ.get("RELIGION_VOTING_OFFLINE", "") not in ("", "0")
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    bounds = Transformer.from_crs(crs, "EPSG:3857", always_xy=True).transform_bounds(xmin, ymin, xmax, ymax)
+    if zoom == "auto":
+        fig = ax.get_figure()
+        zoom = auto_zoom(bounds, fig.get_figwidth() * ax.get_position().width * fig.dpi)
+
+    source = basemap_source(source)
+    conn = open_tile_store(store_path, source)
+    try:
+        image, extent = basemap_image(conn, bounds, zoom, source, offline)
+        if not offline:
+            evict_tiles(conn, max_bytes)
+    finally:
+        close_tile_store(conn)
+
+    if CRS.from_user_input(crs) != CRS.from_epsg(3857):
+        image, extent = warp_image(image, extent, "EPSG:3857", crs)
+    ax.imshow(image, extent=extent, alpha=alpha, interpolation="bilinear", zorder=0)
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+
+
+def seed_project_basemap(store_path=BASEMAP_STORE, zooms=range(4, 9), source=None, max_workers=1):
+    """Pre-seed the tile store for the atlas extent (g_rwUL to g_rwLR), for offline rendering."""
+    bounds = Transformer.from_crs("EPSG:32633", "EPSG:3857", always_xy=True).transform_bounds(
+        g_rwUL[0], g_rwLR[1], g_rwLR[0], g_rwUL[1]
+    )
+    return seed_tiles(store_path, bounds, zooms, source, max_workers)
+
+
+def add_project_basemap(ax, basemap="osm", crs="EPSG:3857", alpha=1.0):
+    """Add the basemap named `basemap`: 'osm' (local tile store), 'atlas' (atlas map tiles) or None."""
+    if basemap == "osm":
+        add_basemap(ax, crs=crs, alpha=alpha)
+    elif basemap == "atlas":
+        add_atlas_basemap(ax, ATLAS_MAPTILES_DIR, crs=crs, alpha=alpha)
+
+
+def atlas_tile_transform(zoomLevel=1):
+    """Size of one atlas map tile pixel in EPSG:32633 units and the pixel origin (upper left)."""
+    return 1 / get_scaleFactor(zoomLevel), g_rwUL
+
+
+def atlas_basemap_image(maptiles_dir, bounds=None, zoomLevel=1):
+    """
+    Mosaic of the downloaded atlas map tiles (`R{row:08X}_C{col:08X}.JPG`) as an RGB
+    array plus its extent `(minx, maxx, miny, maxy)` in EPSG:32633, limited to the
+    tiles intersecting `bounds` if given.
+    """
+    pixel, (x0, y0) = atlas_tile_transform(zoomLevel)
+    span = pixel * TILE_SIZE
+    tiles = {}
+    for path in glob.glob(os.path.join(maptiles_dir, "R*_C*.JPG")):
+        name = os.path.basename(path)[:-4]
+        row, col = int(name[1:9], 16), int(name[11:19], 16)
+        if bounds is not None:
+            minx, miny, maxx, maxy = bounds
+            left, top = x0 + col * span, y0 - row * span
+            if left > maxx or left + span < minx or top < miny or top - span > maxy:
+                continue
+        tiles[(row, col)] = path
+    if not tiles:
+        return None, None
+
+    rows = [row for row, _ in tiles]
+    cols = [col for _, col in tiles]
+    r0, c0 = min(rows), min(cols)
+    image = np.full(((max(rows) - r0 + 1) * TILE_SIZE, (max(cols) - c0 + 1) * TILE_SIZE, 3), 255, dtype=np.uint8)
+    for (row, col), path in tiles.items():
+        with Image.open(path) as tile:
+            image[(row - r0) * TILE_SIZE:(row - r0 + 1) * TILE_SIZE,
+                  (col - c0) * TILE_SIZE:(col - c0 + 1) * TILE_SIZE] = np.asarray(tile.convert("RGB"))
+    extent = (x0 + c0 * span, x0 + (max(cols) + 1) * span, y0 - (max(rows) + 1) * span, y0 - r0 * span)
+    return image, extent
+
+
+def add_atlas_basemap(ax, maptiles_dir, crs="EPSG:32633", alpha=1.0, zoomLevel=1):
+    """
+    Use the downloaded atlas map tiles as basemap, without any network access. On
+    axes in another CRS than EPSG:32633 the mosaic is warped with rasterio first.
+    """
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    to_atlas = Transformer.from_crs(crs, "EPSG:32633", always_xy=True)
+    bounds = to_atlas.transform_bounds(xmin, ymin, xmax, ymax)
+    image, extent = atlas_basemap_image(maptiles_dir, bounds, zoomLevel)
+    if image is None:
+        print(f"⚠️ No atlas map tiles found in {maptiles_dir} for this extent")
+        return
+
+    if CRS.from_user_input(crs) != CRS.from_epsg(32633):
+        image, extent = warp_image(image, extent, "EPSG:32633", crs)
+    ax.imshow(image, extent=extent, alpha=alpha, interpolation="bilinear", zorder=0)
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+
+
+def warp_image(image, extent, src_crs, dst_crs):
+    """
+    Reproject an RGB(A) image with extent `(minx, maxx, miny, maxy)` to another CRS.
+    Returns an RGBA image that is transparent outside the source image.
+    """
+    # rasterio is only needed for warping, so it is not a hard dependency of the plots
+    import rasterio.warp
+    from rasterio.transform import from_bounds
+
+    if image.shape[2] == 3:
+        image = np.dstack([image, np.full(image.shape[:2], 255, dtype=image.dtype)])
+    height, width, bands = image.shape
+    minx, maxx, miny, maxy = extent
+    src_transform = from_bounds(minx, miny, maxx, maxy, width, height)
+    dst_transform, dst_width, dst_height = rasterio.warp.calculate_default_transform(
+        src_crs, dst_crs, width, height, left=minx, bottom=miny, right=maxx, top=maxy
+    )
+    warped = np.zeros((bands, dst_height, dst_width), dtype=image.dtype)
+    rasterio.warp.reproject(
+        np.moveaxis(image, -1, 0), warped,
+        src_transform=src_transform, src_crs=src_crs,
+        dst_transform=dst_transform, dst_crs=dst_crs,
+        resampling=rasterio.warp.Resampling.bilinear,
+    )
+    left, top = dst_transform.c, dst_transform.f
+    right, bottom = left + dst_transform.a * dst_width, top + dst_transform.e * dst_height
+    return np.moveaxis(warped, 0, -1), (left, right, bottom, top)
@@ -0,0 +1,122 @@
+import os
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import geopandas as gpd
+import matplotlib
+import matplotlib.pyplot as plt
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+from src.fun_profile import profiled
+from src.plot_maps.fun_raster import plot_raster_column
+
+# Projected map data of the current worker process, loaded once by `init_worker`
+BATCH_DATA = None
+
+
+def spec_columns(specs):
+    """All data columns the map specs refer to (plotted columns and filter columns)."""
+    columns = []
+    for spec in specs:
+        columns.append(spec["column"])
+        columns.extend((spec.get("filter") or {}).keys())
+    return list(dict.fromkeys(columns))
+
+
+def prepare_batch_data(map_data, specs, work_dir, epsg=3857):
+    """
+    Project the map data once and store only the geometry and the columns used by
+    `specs` as GeoParquet in `work_dir`, for the worker processes to load.
+    """
+    map_data = map_data[spec_columns(specs) + [map_data.geometry.name]].to_crs(epsg=epsg)
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, "batch_map_data.parquet")
+    map_data.to_parquet(path)
+    return path
+
+
+def init_worker(data_path):
+    """Worker initializer: headless backend, and the projected map data loaded once per process."""
+    global BATCH_DATA
+    matplotlib.use("Agg")
+    BATCH_DATA = gpd.read_parquet(data_path)
+
+
+def select_rows(map_data, filters):
+    """Rows matching every `{column: value}` filter; list values are matched with `isin`."""
+    mask = np.ones(len(map_data), dtype=bool)
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            mask &= map_data[column].isin(value).to_numpy()
+        else:
+            mask &= (map_data[column] == value).to_numpy()
+    return map_data[mask]
+
+
+def render_map(spec):
+    """
+    Render one map spec from the worker's BATCH_DATA to `spec["output"]`.
+    Returns `(output, seconds)`.
+    """
+    start = time.perf_counter()
+    column, cmap = spec["column"], spec.get("cmap", "Reds")
+    label = spec.get("label", column)
+    dpi = spec.get("dpi", 300)
+    map_data = select_rows(BATCH_DATA, spec.get("filter"))
+
+    vmin = map_data[column].quantile(0.05)
+    vmax = map_data[column].quantile(0.95)
+
+    fig, ax = plt.subplots(1, 1, figsize=spec.get("figsize", (12, 8)))
+    if spec.get("render", "raster") == "raster":
+        plot_raster_column(map_data, column, ax, cmap, vmin, vmax, dpi)
+    else:
+        map_data.plot(column=column, cmap=cmap, linewidth=0.0, ax=ax, edgecolor='none',
+                      legend=False, vmin=vmin, vmax=vmax)
+        ax.set_xlim(map_data.total_bounds[0], map_data.total_bounds[2])
+        ax.set_ylim(map_data.total_bounds[1], map_data.total_bounds[3])
+
+    divider = make_axes_locatable(ax)
+    cax = divider.append_axes("right", size="2%", pad=0.1)
+    sm = plt.cm.ScalarMappable(cmap=cmap, norm=plt.Normalize(vmin=vmin, vmax=vmax))
+    sm._A = []
+    cbar = plt.colorbar(sm, cax=cax)
+    cbar.set_label(label)
+    ax.set_title(spec.get("title", f"Distribution of {label}"))
+    ax.axis('off')
+
+    os.makedirs(os.path.dirname(spec["output"]) or ".", exist_ok=True)
+    fig.savefig(spec["output"], dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return spec["output"], time.perf_counter() - start
+
+
+@profiled(counts=lambda timings: {"maps": len(timings)})
+def render_maps(map_data, specs, work_dir=None, workers=None):
+    """
+    Render a batch of choropleth maps in parallel, without blocking on `plt.show()`.
+
+    Every spec is a dict with `column` and `output`, and optionally `cmap`, `label`,
+    `title`, `filter` ({column: value or list of values}), `render` ('raster' or
+    'vector'), `dpi` and `figsize`. The geometry is projected once; each worker
+    process loads the projected data a single time in its initializer, so only the
+    small spec dicts are sent per map. The projected data is a scratch file in a
+    temporary folder (inside `work_dir` if given) that is removed afterwards.
+    Returns `{output: seconds}`.
+    """
+    total = time.perf_counter()
+    if work_dir:
+        os.makedirs(work_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as scratch_dir:
+        data_path = prepare_batch_data(map_data, specs, scratch_dir)
+        timings = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(data_path,)) as executor:
+            futures = [executor.submit(render_map, spec) for spec in specs]
+            for future in as_completed(futures):
+                output, seconds = future.result()
+                timings[output] = seconds
+                print(f"✅ {output} rendered in {seconds:.1f}s")
+    print(f"📊 Rendered {len(specs)} maps in {time.perf_counter() - total:.1f}s")
+    return timings
@@ -0,0 +1,102 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from src.fun_cache import cache_key
+
+# Clipped overlay layers of recent calls, keyed by filter values and data digests
+CLIP_CACHE = OrderedDict()
+CLIP_CACHE_SIZE = 8
+
+INSIDE, OUTSIDE, CROSSING = 0, 1, 2
+
+
+def geometry_digest(geometries):
+    """Digest of a geometry array's WKB, to recognise unchanged input data."""
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(np.asarray(geometries, dtype=object)):
+        digest.update(wkb if wkb is not None else b"\0")
+    return digest.hexdigest()
+
+
+def column_digest(df, columns):
+    """Digest of the values (and index) of some columns, to recognise unchanged attributes."""
+    hashes = pd.util.hash_pandas_object(df[list(columns)], index=True).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def classify_against(geometries, boundary):
+    """
+    Classify every geometry as INSIDE, OUTSIDE or CROSSING `boundary`.
+    An STRtree query with the boundary's envelope rules out the polygons that cannot
+    touch it; the rest are tested against the prepared boundary with vectorized
+    `contains_properly` / `intersects` calls.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    classes = np.full(len(geometries), OUTSIDE, dtype=np.int8)
+    candidates = shapely.STRtree(geometries).query(shapely.envelope(boundary), predicate="intersects")
+    if len(candidates) == 0:
+        return classes
+
+    shapely.prepare(boundary)
+    inside = shapely.contains_properly(boundary, geometries[candidates])
+    crossing = ~inside & shapely.intersects(boundary, geometries[candidates])
+    classes[candidates[inside]] = INSIDE
+    classes[candidates[crossing]] = CROSSING
+    return classes
+
+
+def clip_to_boundary(gdf, boundary):
+    """
+    Clip polygons to `boundary`, like `gdf.intersection(boundary)` without the empty
+    results, but only the polygons crossing the boundary are actually intersected.
+    """
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    classes = classify_against(geometries, boundary)
+    clipped = geometries.copy()
+    crossing = classes == CROSSING
+    if crossing.any():
+        clipped[crossing] = shapely.intersection(geometries[crossing], boundary)
+    clipped = gpd.GeoDataFrame(geometry=clipped, index=gdf.index, crs=gdf.crs)
+    keep = (classes != OUTSIDE) & ~shapely.is_empty(clipped.geometry.values)
+    return clipped[keep]
+
+
+def filtered_clipped_layer(enriched_gdf, filters, target, boundary=None):
+    """
+    Polities matching every `{column: value}` in `filters`, reprojected to the CRS of
+    `target` and clipped to `boundary` (default: the union of `target`'s geometries).
+    The result is kept in CLIP_CACHE, keyed by the filter values, the target CRS and
+    digests of the input geometries and of the filtered columns, so repeated calls
+    skip the reprojection, filtering and clipping. Callers get a copy of the cached layer.
+    """
+    boundary_digest = geometry_digest([boundary] if boundary is not None else target.geometry.values)
+    key = cache_key(
+        sorted(filters.items()),
+        str(target.crs),
+        geometry_digest(enriched_gdf.geometry.values),
+        column_digest(enriched_gdf, filters),
+        boundary_digest,
+    )
+    if key in CLIP_CACHE:
+        CLIP_CACHE.move_to_end(key)
+        return CLIP_CACHE[key].copy()
+
+    enriched_gdf = enriched_gdf.to_crs(target.crs)
+    mask = np.ones(len(enriched_gdf), dtype=bool)
+    for column, value in filters.items():
+        mask &= (enriched_gdf[column] == value).to_numpy()
+    filtered_gdf = enriched_gdf[mask]
+    filtered_gdf = filtered_gdf[filtered_gdf.is_valid]
+    if boundary is None:
+        boundary = target.unary_union
+    clipped_gdf = clip_to_boundary(filtered_gdf, boundary)
+
+    CLIP_CACHE[key] = clipped_gdf
+    if len(CLIP_CACHE) > CLIP_CACHE_SIZE:
+        CLIP_CACHE.popitem(last=False)
+    return clipped_gdf.copy()
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from src.data_management.fun_boundaries import write_parquet_atomic
+from src.fun_cache import cache_key
+from src.fun_profile import profiled
+from src.get_data.fun_topology import build_topology, simplify_topology, topology_to_geodataframe
+from src.plot_maps.fun_clip import geometry_digest
+
+# Simplification tolerances of the pyramid levels, in CRS units (metres for VG250 and the atlas map)
+LOD_TOLERANCES = (25, 100, 400, 1600)
+# Stored with the project data (data/.cache/lod), wherever the plots are run from
+LOD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", ".cache", "lod")
+
+
+@profiled(counts=None)
+def build_lod_pyramid(gdf, tolerances=LOD_TOLERANCES, grid_size=0.001):
+    """
+    Simplified copies of `gdf`'s geometry, one per tolerance. The polygons are
+    converted to a topology once and every shared border is simplified a single
+    time, so neighbours stay gap- and overlap-free at every level.
+    Returns `{tolerance: geometry array}` in the row order of `gdf`.
+    """
+    topology = build_topology(gdf[[gdf.geometry.name]], grid_size=grid_size)
+    levels = {}
+    for tolerance in tolerances:
+        level = topology_to_geodataframe(simplify_topology(topology, tolerance))
+        geometries = np.asarray(level.geometry.values, dtype=object)
+        invalid = ~shapely.is_valid(geometries)
+        if invalid.any():
+            geometries[invalid] = shapely.make_valid(geometries[invalid])
+        levels[tolerance] = geometries
+    return levels
+
+
+def load_lod_pyramid(gdf, name, tolerances=LOD_TOLERANCES, lod_dir=LOD_DIR):
+    """
+    LOD pyramid of `gdf` (see `build_lod_pyramid`), stored as one GeoParquet file per
+    level in `lod_dir` and keyed by a digest of the geometry, so it is built once per
+    geometry set (e.g. all municipalities, or a West German subset) and reused by
+    every later plot. Files are written atomically, as concurrent pipeline stages may
+    build the same pyramid.
+    """
+    digest = cache_key(geometry_digest(gdf.geometry.values), str(gdf.crs))
+    paths = {tolerance: os.path.join(lod_dir, f"{name}_lod{tolerance}_{digest}.parquet") for tolerance in tolerances}
+    if all(os.path.exists(path) for path in paths.values()):
+        return {tolerance: gpd.read_parquet(path).geometry.values for tolerance, path in paths.items()}
+
+    os.makedirs(lod_dir, exist_ok=True)
+    levels = build_lod_pyramid(gdf, tolerances)
+    for tolerance, path in paths.items():
+        write_parquet_atomic(gpd.GeoDataFrame(geometry=levels[tolerance], crs=gdf.crs), path)
+    print(f"✅ Built {len(tolerances)} LOD levels for {name} in {lod_dir}")
+    return {tolerance: gpd.GeoSeries(levels[tolerance], crs=gdf.crs).values for tolerance in tolerances}
+
+
+def pick_tolerance(bounds, figsize, dpi, tolerances=LOD_TOLERANCES, pixel_fraction=0.5):
+    """
+    Coarsest tolerance that is visually lossless for a map of `bounds` drawn on
+    `figsize` inches at `dpi`: vertices may move by at most `pixel_fraction` of a
+    pixel. Returns None if even the finest level is too coarse.
+    """
+    minx, miny, maxx, maxy = bounds
+    pixel = max((maxx - minx) / (figsize[0] * dpi), (maxy - miny) / (figsize[1] * dpi))
+    fitting = [tolerance for tolerance in tolerances if tolerance <= pixel_fraction * pixel]
+    return max(fitting) if fitting else None
+
+
+def lod_geometries(gdf, name, figsize, dpi, tolerances=LOD_TOLERANCES, lod_dir=LOD_DIR):
+    """
+    `gdf` with its geometry swapped for the coarsest pyramid level that is visually
+    lossless at `figsize` and `dpi` (unchanged if no level qualifies). Must be called
+    before reprojecting, as tolerances are in `gdf`'s CRS units.
+    """
+    tolerance = pick_tolerance(gdf.total_bounds, figsize, dpi, tolerances)
+    if tolerance is None or gdf.empty:
+        return gdf
+    levels = load_lod_pyramid(gdf, name, tolerances, lod_dir)
+    result = gdf.copy(deep=False)
+    result[gdf.geometry.name] = gpd.GeoSeries(levels[tolerance], index=gdf.index, crs=gdf.crs)
+    return result
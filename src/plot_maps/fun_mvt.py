@@ -0,0 +1,274 @@
+import os
+import gzip
+import json
+import sqlite3
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from src.fun_profile import profiled
+from src.plot_maps.fun_basemap import WEB_MERCATOR_HALF, tile_range
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64  # tile-pixel margin clipped around each tile, so strokes don't end at tile edges
+
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POINT, LINESTRING, POLYGON = 1, 2, 3
+
+
+# ----------------------------------------------------------------------
+# Protobuf encoding (vector_tile.proto, version 2)
+# ----------------------------------------------------------------------
+def varint(value):
+    """Protobuf base-128 varint of a non-negative integer."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def field(number, wire_type, payload):
+    """One protobuf field: key, then the payload (length-prefixed for wire type 2)."""
+    key = varint((number << 3) | wire_type)
+    if wire_type == 2:
+        return key + varint(len(payload)) + payload
+    return key + payload
+
+
+def packed(number, values):
+    """A packed repeated uint32 field."""
+    return field(number, 2, b"".join(varint(int(value)) for value in values))
+
+
+def zigzag(values):
+    """ZigZag-encode signed integers as used for MVT geometry parameters."""
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+
+def encode_value(value):
+    """Layer `Value` message for a property value."""
+    if isinstance(value, (bool, np.bool_)):
+        return field(7, 0, varint(int(value)))
+    if isinstance(value, (int, np.integer)):
+        return field(6, 0, varint(int(zigzag([int(value)])[0])))
+    if isinstance(value, (float, np.floating)):
+        return field(3, 1, np.float64(value).tobytes())
+    return field(1, 2, str(value).encode("utf-8"))
+
+
+def ring_commands(ring, cursor, close):
+    """Geometry commands of one ring/line given as integer tile coordinates."""
+    deltas = np.diff(np.vstack([cursor, ring]), axis=0)
+    commands = [MOVE_TO | (1 << 3), *zigzag(deltas[0])]
+    if len(deltas) > 1:
+        commands.append(LINE_TO | ((len(deltas) - 1) << 3))
+        commands.extend(zigzag(deltas[1:]).ravel())
+    if close:
+        commands.append(CLOSE_PATH | (1 << 3))
+    return commands, ring[-1]
+
+
+def signed_area(ring):
+    """Surveyor's formula area of an open ring (positive = clockwise on screen in tile coordinates)."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def geometry_commands(geometry, to_tile):
+    """
+    MVT geometry type and command integers of a (multi)point, line or polygon, with
+    coordinates mapped to integer tile coordinates by `to_tile`. Rings collapsing to
+    fewer than three distinct points are dropped; exterior rings are wound clockwise
+    and holes counter-clockwise on screen, as the spec requires.
+    """
+    type_id = shapely.get_type_id(geometry)
+    cursor = np.zeros(2, dtype=np.int64)
+    commands = []
+    if type_id in (0, 4):
+        points = to_tile(shapely.get_coordinates(geometry))
+        deltas = np.diff(np.vstack([cursor, points]), axis=0)
+        return POINT, [MOVE_TO | (len(points) << 3), *zigzag(deltas).ravel()]
+    if type_id in (1, 5):
+        for line in shapely.get_parts(geometry):
+            xy = to_tile(shapely.get_coordinates(line))
+            xy = xy[np.r_[True, (np.diff(xy, axis=0) != 0).any(axis=1)]]
+            if len(xy) >= 2:
+                part, cursor = ring_commands(xy, cursor, close=False)
+                commands.extend(part)
+        return LINESTRING, commands
+    for polygon in shapely.get_parts(geometry):
+        if shapely.get_type_id(polygon) != 3:
+            continue
+        for k, ring in enumerate([polygon.exterior, *polygon.interiors]):
+            xy = to_tile(shapely.get_coordinates(ring))[:-1]
+            xy = xy[np.r_[True, (np.diff(xy, axis=0) != 0).any(axis=1)]]
+            if len(xy) < 3 or signed_area(xy) == 0:
+                if k == 0:
+                    break
+                continue
+            if (signed_area(xy) > 0) != (k == 0):
+                xy = xy[::-1]
+            part, cursor = ring_commands(xy, cursor, close=True)
+            commands.extend(part)
+    return POLYGON, commands
+
+
+def encode_layer(name, geometries, properties, to_tile, ids=None):
+    """Encode one MVT layer from tile-clipped geometries and a list of property dicts."""
+    keys, values = {}, {}
+    features = []
+    for i, (geometry, record) in enumerate(zip(geometries, properties)):
+        geom_type, commands = geometry_commands(geometry, to_tile)
+        if not commands:
+            continue
+        tags = []
+        for key, value in record.items():
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            value_bytes = encode_value(value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value_bytes, len(values)))
+        feature = b""
+        if ids is not None:
+            feature += field(1, 0, varint(int(ids[i])))
+        feature += packed(2, tags) + field(3, 0, varint(geom_type)) + packed(4, commands)
+        features.append(field(2, 2, feature))
+    if not features:
+        return b""
+    layer = field(15, 0, varint(2)) + field(1, 2, name.encode("utf-8")) + b"".join(features)
+    layer += b"".join(field(3, 2, key.encode("utf-8")) for key in keys)
+    layer += b"".join(field(4, 2, value) for value in values)
+    layer += field(5, 0, varint(MVT_EXTENT))
+    return field(3, 2, layer)
+
+
+# ----------------------------------------------------------------------
+# Tiling
+# ----------------------------------------------------------------------
+def tile_bounds(z, x, y):
+    """EPSG:3857 bounds of XYZ tile (z, x, y)."""
+    span = 2 * WEB_MERCATOR_HALF / (1 << z)
+    minx = -WEB_MERCATOR_HALF + x * span
+    maxy = WEB_MERCATOR_HALF - y * span
+    return minx, maxy - span, minx + span, maxy
+
+
+def prepare_layers(layers):
+    """
+    Reproject every layer to EPSG:3857 once, and index it with an STRtree.
+    `layers` maps layer names to GeoDataFrames.
+    """
+    prepared = {}
+    for name, gdf in layers.items():
+        gdf = gdf.to_crs(epsg=3857)
+        geometries = np.asarray(gdf.geometry.values, dtype=object)
+        records = gdf.drop(columns=gdf.geometry.name).to_dict("records")
+        prepared[name] = (geometries, records, shapely.STRtree(geometries))
+    return prepared
+
+
+def render_tile(prepared, z, x, y):
+    """Encode XYZ tile (z, x, y) of all prepared layers; empty bytes if nothing falls into it."""
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    span = maxx - minx
+    margin = span * MVT_BUFFER / MVT_EXTENT
+    box = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+    scale = MVT_EXTENT / span
+
+    def to_tile(xy):
+        return np.round(np.column_stack([(xy[:, 0] - minx) * scale, (maxy - xy[:, 1]) * scale])).astype(np.int64)
+
+    tile = b""
+    for name, (geometries, records, tree) in prepared.items():
+        hits = np.sort(tree.query(shapely.box(*box), predicate="intersects"))
+        if len(hits) == 0:
+            continue
+        clipped = shapely.clip_by_rect(geometries[hits], *box)
+        # Simplify to a quarter tile pixel; vertices closer than that collapse when rounded anyway
+        clipped = shapely.simplify(clipped, 0.25 / scale, preserve_topology=True)
+        keep = ~shapely.is_empty(clipped)
+        tile += encode_layer(
+            name, clipped[keep], [records[i] for i in hits[keep]], to_tile, ids=hits[keep]
+        )
+    return tile
+
+
+def layer_bounds(prepared):
+    """Union of the EPSG:3857 bounds of all prepared layers."""
+    bounds = np.array([shapely.total_bounds(geometries) for geometries, _, _ in prepared.values()])
+    return bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+
+
+@profiled(counts=lambda count: {"tiles": count})
+def export_mbtiles(layers, output_path, minzoom=4, maxzoom=11, name=None):
+    """
+    Pre-generate Mapbox Vector Tiles of `layers` ({layer name: GeoDataFrame}) for all
+    zooms from `minzoom` to `maxzoom` into a single MBTiles archive (gzip-compressed
+    pbf tiles, TMS rows, TileJSON-style metadata with the layer fields).
+    Returns the number of tiles written.
+    """
+    prepared = prepare_layers(layers)
+    bounds = layer_bounds(prepared)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript("""
+        CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+                            PRIMARY KEY (zoom_level, tile_column, tile_row));
+    """)
+
+    count = 0
+    for z in range(minzoom, maxzoom + 1):
+        xs, ys = tile_range(bounds, z)
+        rows = []
+        for x in xs:
+            for y in ys:
+                tile = render_tile(prepared, z, x, y)
+                if tile:
+                    rows.append((z, x, (1 << z) - 1 - y, gzip.compress(tile, compresslevel=6)))
+        conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        count += len(rows)
+        print(f"📦 Zoom {z}: {len(rows)} tiles")
+
+    lon_lat = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True).transform_bounds(*bounds)
+    vector_layers = [
+        {"id": layer, "fields": {column: "String" if gdf[column].dtype == object else "Number"
+                                  for column in gdf.columns if column != gdf.geometry.name},
+         "minzoom": minzoom, "maxzoom": maxzoom}
+        for layer, gdf in layers.items()
+    ]
+    metadata = {
+        "name": name or os.path.splitext(os.path.basename(output_path))[0],
+        "format": "pbf",
+        "minzoom": str(minzoom),
+        "maxzoom": str(maxzoom),
+        "bounds": ",".join(f"{value:.6f}" for value in lon_lat),
+        "center": f"{(lon_lat[0] + lon_lat[2]) / 2:.6f},{(lon_lat[1] + lon_lat[3]) / 2:.6f},{minzoom}",
+        "json": json.dumps({"vector_layers": vector_layers}),
+    }
+    conn.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, output_path)
+    print(f"✅ Wrote {count} vector tiles to {output_path}")
+    return count
+
+
+def read_metadata(mbtiles_path):
+    """Metadata table of an MBTiles archive as a dict."""
+    conn = sqlite3.connect(mbtiles_path)
+    metadata = dict(conn.execute("SELECT name, value FROM metadata").fetchall())
+    conn.close()
+    return metadata
+
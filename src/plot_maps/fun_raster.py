@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib.pyplot as plt
+import shapely
+from PIL import Image, ImageDraw
+
+from src.fun_cache import cache_key
+from src.plot_maps.fun_clip import geometry_digest
+
+# Label rasters of recent calls, keyed by geometry digest, extent and raster shape
+LABEL_CACHE = OrderedDict()
+LABEL_CACHE_SIZE = 4
+
+
+def raster_shape(bounds, ax, dpi):
+    """
+    Raster size (width, height) that fills the axes `ax` at `dpi` with the map
+    extent `bounds`, keeping the map's aspect ratio like geopandas' equal-aspect plots.
+    """
+    fig = ax.get_figure()
+    box = ax.get_position()
+    width_px = fig.get_figwidth() * box.width * dpi
+    height_px = fig.get_figheight() * box.height * dpi
+    minx, miny, maxx, maxy = bounds
+    scale = min(width_px / (maxx - minx), height_px / (maxy - miny))
+    return max(1, int(np.ceil((maxx - minx) * scale))), max(1, int(np.ceil((maxy - miny) * scale)))
+
+
+def rasterize_labels(geometries, bounds, width, height):
+    """
+    Burn polygons into an int32 label raster: pixel value `i + 1` for the i-th
+    geometry, 0 for background. Polygon parts are drawn largest shell first (the area
+    inside the exterior ring, holes included) and holes are cleared right after their
+    shell, so enclaves, which always have a smaller shell, are drawn later and stay visible.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    minx, miny, maxx, maxy = bounds
+    sx, sy = width / (maxx - minx), height / (maxy - miny)
+
+    image = Image.new("I", (width, height), 0)
+    draw = ImageDraw.Draw(image)
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    polygons = shapely.get_type_id(parts) == 3
+    parts, index = parts[polygons], index[polygons]
+    shell_areas = shapely.area(shapely.polygons(shapely.get_exterior_ring(parts)))
+    for j in np.argsort(-shell_areas, kind="stable"):
+        polygon, i = parts[j], index[j]
+        if shapely.is_empty(polygon):
+            continue
+        rings = [polygon.exterior, *polygon.interiors]
+        for k, ring in enumerate(rings):
+            xy = shapely.get_coordinates(ring)
+            pixels = np.column_stack([(xy[:, 0] - minx) * sx, (maxy - xy[:, 1]) * sy])
+            if len(pixels) >= 3:
+                draw.polygon(pixels.ravel().tolist(), fill=int(i + 1) if k == 0 else 0)
+    return np.asarray(image, dtype=np.int32)
+
+
+def label_raster(gdf, bounds, width, height):
+    """`rasterize_labels` for a GeoDataFrame, reused from LABEL_CACHE for the same geometry and grid."""
+    key = cache_key(geometry_digest(gdf.geometry.values), tuple(map(float, bounds)), width, height)
+    if key in LABEL_CACHE:
+        LABEL_CACHE.move_to_end(key)
+        return LABEL_CACHE[key]
+    labels = rasterize_labels(gdf.geometry.values, bounds, width, height)
+    LABEL_CACHE[key] = labels
+    if len(LABEL_CACHE) > LABEL_CACHE_SIZE:
+        LABEL_CACHE.popitem(last=False)
+    return labels
+
+
+def value_colors(values, cmap, vmin, vmax):
+    """RGBA color of every feature for a numeric column; missing values are transparent."""
+    values = np.asarray(values, dtype=np.float64)
+    colors = plt.get_cmap(cmap)(plt.Normalize(vmin=vmin, vmax=vmax)(values))
+    colors[np.isnan(values)] = 0
+    return colors
+
+
+def colorize(labels, colors):
+    """
+    Turn a label raster into an RGBA image with a lookup table: entry 0 is the
+    transparent background, entry `i + 1` the color of feature i.
+    """
+    lut = np.zeros((len(colors) + 1, 4), dtype=np.uint8)
+    lut[1:] = np.round(np.asarray(colors, dtype=np.float64) * 255)
+    return lut[labels]
+
+
+def draw_raster(ax, image, bounds, **kwargs):
+    """Show an RGBA map image in data coordinates, with the axes fitted to `bounds`."""
+    minx, miny, maxx, maxy = bounds
+    ax.imshow(
+        image, extent=(minx, maxx, miny, maxy), origin="upper", interpolation="nearest", **kwargs
+    )
+    ax.set_xlim(minx, maxx)
+    ax.set_ylim(miny, maxy)
+    ax.set_aspect("equal")
+
+
+def plot_raster_column(gdf, column, ax, cmap, vmin, vmax, dpi, bounds=None):
+    """
+    Raster counterpart of `gdf.plot(column=..., cmap=..., vmin=..., vmax=...)`: the
+    geometry is rasterized once per extent and resolution (see `label_raster`) and
+    each column only costs a color lookup.
+    """
+    bounds = gdf.total_bounds if bounds is None else bounds
+    width, height = raster_shape(bounds, ax, dpi)
+    labels = label_raster(gdf, bounds, width, height)
+    draw_raster(ax, colorize(labels, value_colors(gdf[column], cmap, vmin, vmax)), bounds)
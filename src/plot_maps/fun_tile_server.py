@@ -0,0 +1,104 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.plot_maps.fun_mvt import read_metadata
+
+TILE_CACHE_SIZE = 4096
+
+
+def make_tile_reader(mbtiles_path, cache_size=TILE_CACHE_SIZE):
+    """
+    Return `read(z, x, y)` for XYZ tiles of an MBTiles archive, answering repeated
+    requests from an in-memory LRU cache of `cache_size` tiles (gzip bytes as stored).
+    """
+    conn = sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True, check_same_thread=False)
+    lock = threading.Lock()
+    cache = OrderedDict()
+
+    def read(z, x, y):
+        key = (z, x, y)
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            row = conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, (1 << z) - 1 - y),
+            ).fetchone()
+            tile = None if row is None else row[0]
+            cache[key] = tile
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+            return tile
+
+    return read
+
+
+def make_handler(read_tile, tilejson):
+    """Request handler serving `/{z}/{x}/{y}.pbf` tiles and `/tiles.json` (TileJSON)."""
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].strip("/")
+            if path == "tiles.json":
+                body = json.dumps(dict(tilejson, tiles=[f"http://{self.headers['Host']}/{{z}}/{{x}}/{{y}}.pbf"]))
+                return self.respond(200, body.encode("utf-8"), "application/json")
+            parts = path[:-4].split("/") if path.endswith(".pbf") else []
+            if len(parts) != 3 or not all(part.isdigit() for part in parts):
+                return self.respond(404, b"not found", "text/plain")
+            tile = read_tile(*map(int, parts))
+            if tile is None:
+                return self.respond(204, b"", "application/x-protobuf")
+            self.respond(200, tile, "application/x-protobuf", {"Content-Encoding": "gzip"})
+
+        def respond(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "public, max-age=3600")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+
+def tilejson_from_metadata(metadata):
+    """TileJSON document (without the tile URL) from MBTiles metadata."""
+    layers = json.loads(metadata.get("json", "{}")).get("vector_layers", [])
+    return {
+        "tilejson": "3.0.0",
+        "name": metadata.get("name"),
+        "minzoom": int(metadata.get("minzoom", 0)),
+        "maxzoom": int(metadata.get("maxzoom", 14)),
+        "bounds": [float(value) for value in metadata["bounds"].split(",")] if "bounds" in metadata else None,
+        "vector_layers": layers,
+    }
+
+
+def make_tile_server(mbtiles_path, host="127.0.0.1", port=8080, cache_size=TILE_CACHE_SIZE):
+    """Threaded HTTP server for an MBTiles vector tile archive (call `serve_forever()` on it)."""
+    tilejson = tilejson_from_metadata(read_metadata(mbtiles_path))
+    handler = make_handler(make_tile_reader(mbtiles_path, cache_size), tilejson)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_tiles(mbtiles_path, host="127.0.0.1", port=8080, cache_size=TILE_CACHE_SIZE):
+    """Serve an MBTiles vector tile archive until interrupted."""
+    server = make_tile_server(mbtiles_path, host, port, cache_size)
+    print(f"🌍 Serving {mbtiles_path} at http://{host}:{port}/{{z}}/{{x}}/{{y}}.pbf "
+          f"(TileJSON: http://{host}:{port}/tiles.json)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Tile server stopped")
+    finally:
+        server.server_close()
@@ -1,4 +1,4 @@
-from fun import (
+from src.plot_maps.fun import (
     load_geodata,
     load_religion_data,
     merge_data_religion,
@@ -6,54 +6,91 @@ from fun import (
     plot_hre_comparison,
     plot_religion_maps_side_by_side
 )
+from src.plot_maps.fun_batch import render_maps
+from src.data_management.fun_boundaries import load_national_boundary
 
+import os
 import geopandas as gpd
 
 # Define file paths
 geo_filepath = '../../data/shapefiles/vg250_ebenen_1231/DE_VG250.gpkg'
 religion_filepath = '../../data/zensus/religion.xlsx'
 enriched_filepath =  '../../data/hre/digital_atlas/map/enriched_map.shp'
+output_folder = '../../bld/maps'
 
-# 1) Load geographic data
-gem_data = load_geodata(geo_filepath)
+west_germany_keys = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10']
 
-# 2) Load religion data
-religion_data = load_religion_data(religion_filepath)
 
-# 3) Merge them
-map_data_religion = merge_data_religion(gem_data, religion_data)
+def plot_comparison_maps(map_data_religion, enriched_gdf, germany_boundary, output_folder=output_folder):
+    """Side-by-side religion maps, the HRE comparison and the Catholic overlay map."""
+    plot_religion_maps_side_by_side(
+        map_data_religion,
+        columns=['Catholic', 'Protestant', 'None'],
+        cmaps=['Reds', 'Blues', 'Greys'],
+        legend_labels=['Catholics %', 'Protestants %', 'None %'],
+        output_folder=output_folder,
+        filename="religion_maps_side_by_side.png"
+    )
 
-# 4) Get enriched HRE map data
-enriched_gdf = gpd.read_file(enriched_filepath)
 
-plot_religion_maps_side_by_side(
-    map_data_religion,
-    columns=['Catholic', 'Protestant', 'None'],
-    cmaps=['Reds', 'Blues', 'Greys'],
-    legend_labels=['Catholics %', 'Protestants %', 'None %'],
-    output_folder="../../bld/maps",
-    filename="religion_maps_side_by_side.png"
-)
+    plot_hre_comparison(
+        enriched_gdf,
+        geb_filter='r',
+        konf_column='Konf',
+        output_file=os.path.join(output_folder, 'hre_comparison_unique_colors_fixed.png')
+    )
 
+    # 8) Overlay enriched polygons on Catholic map
+    # Overlay the clipped polygons on the Catholic map
+    overlay_catholic_regions_on_map(
+        map_data_religion,
+        enriched_gdf,
+        religion_column='Catholic',
+        filter_column_geb='Geb',
+        filter_value_geb='r',
+        filter_column_konf='Konf',
+        filter_value_konf='ka',
+        overlay_color='gray',
+        fill_opacity=0.55,
+        germany_boundary=germany_boundary,
+        output_file=os.path.join(output_folder, 'catholic_hre_overlay.png')
+    )
 
-plot_hre_comparison(
-    enriched_gdf,
-    geb_filter='r',
-    konf_column='Konf',
-    output_file='../../bld/maps/hre_comparison_unique_colors_fixed.png'
-)
 
-# 8) Overlay enriched polygons on Catholic map
-# Overlay the clipped polygons on the Catholic map
-overlay_catholic_regions_on_map(
-    map_data_religion,
-    enriched_gdf,
-    religion_column='Catholic',
-    filter_column_geb='Geb',
-    filter_value_geb='r',
-    filter_column_konf='Konf',
-    filter_value_konf='ka',
-    overlay_color='gray',
-    fill_opacity=0.55
-)
+def render_single_maps(map_data_religion, output_folder=output_folder, workers=None):
+    """Single-variable maps, rendered headless in parallel from one projected copy."""
+    map_specs = [
+        {"column": column, "cmap": cmap, "label": label, "filter": region_filter,
+         "output": os.path.join(output_folder, f"{column.lower()}_{region}.png")}
+        for column, cmap, label in [
+            ('Catholic', 'Reds', 'Catholics %'),
+            ('Protestant', 'Blues', 'Protestants %'),
+            ('None', 'Greys', 'None %'),
+        ]
+        for region, region_filter in [('germany', None), ('west_germany', {'SN_L': west_germany_keys})]
+    ]
+    return render_maps(map_data_religion, map_specs, workers=workers)
+
+
+def main():
+    # 1) Load geographic data
+    gem_data = load_geodata(geo_filepath)
+
+    # 2) Load religion data
+    religion_data = load_religion_data(religion_filepath)
+
+    # 3) Merge them
+    map_data_religion = merge_data_religion(gem_data, religion_data)
+
+    # 4) Get enriched HRE map data
+    enriched_gdf = gpd.read_file(enriched_filepath)
+
+    plot_comparison_maps(map_data_religion, enriched_gdf, load_national_boundary(geo_filepath))
+
+    # 9) Single-variable maps
+    render_single_maps(map_data_religion, workers=os.cpu_count())
+
 
+# Guard the run so process-pool workers can import this module without re-running it
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from src.plot_maps.fun_mvt import export_mbtiles
+from src.plot_maps.fun_tile_server import serve_tiles
+
+import os
+import geopandas as gpd
+
+# Define file paths
+merged_filepath = '../../bld/data/merged_national_with_signed_distance.gpkg'
+enriched_filepath = '../../data/hre/digital_atlas/map/enriched_map.shp'
+mbtiles_path = '../../bld/tiles/religion_voting.mbtiles'
+
+# Zoom range of the pre-generated tiles; viewers overzoom beyond max_zoom
+min_zoom, max_zoom = 4, 11
+
+# Attributes carried in the municipality tiles (the merged file has one row per election)
+municipality_columns = [
+    'AGS', 'GEN', 'signed_distance_to_border', 'polity_border_distance',
+    'Catholic', 'Protestant', 'None'
+]
+
+
+def export_tiles(merged_filepath=merged_filepath, enriched_filepath=enriched_filepath, mbtiles_path=mbtiles_path):
+    """Export the municipalities, the West German HRE polygon and the polities into one MBTiles archive."""
+    municipalities = gpd.read_file(merged_filepath, layer='municipalities')
+    municipalities = municipalities.drop_duplicates('AGS')
+    municipalities = municipalities[
+        [column for column in municipality_columns if column in municipalities.columns] + ['geometry']
+    ]
+    west_hre = gpd.read_file(merged_filepath, layer='west_hre_polygon')
+    polities = gpd.read_file(enriched_filepath)
+    polities = polities[[column for column in ['region_id', 'HT_NAME', 'Konf', 'Geb'] if column in polities.columns] + ['geometry']]
+
+    return export_mbtiles(
+        {'municipalities': municipalities, 'west_hre_polygon': west_hre, 'polities': polities},
+        mbtiles_path,
+        minzoom=min_zoom,
+        maxzoom=max_zoom,
+    )
+
+
+def main():
+    # 1) Export the layers once into a single MBTiles archive (rebuild by deleting it)
+    if not os.path.exists(mbtiles_path):
+        export_tiles()
+
+    # 2) Serve the tiles locally, e.g. as a QGIS "Vector Tiles" connection
+    serve_tiles(mbtiles_path, port=8080)
+
+
+# Guard the run so the server threads never re-run the export
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import threading
+import http.server
+
+import pytest
+
+from src.get_data import fun_download
+from src.get_data.fun_download import download_files
+
+FILES = {
+    "ok.JS": b"addto_gI(1,0,0,'poly','');" * 100,
+    "flaky.JS": b"flaky content " * 100,
+    "truncated.JS": bytes(range(256)) * 1024,  # several 64 KiB chunks
+    "down.JS": b"never served",
+}
+FLAKY_FAILURES = 2  # 503 responses before flaky.JS is served
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Serves FILES with Range support; flaky.JS answers 503 first, truncated.JS breaks off once, down.JS always 503."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        self.server.requests.append((name, self.headers.get("Range")))
+        hits = sum(request[0] == name for request in self.server.requests)
+        if name not in FILES:
+            return self.reply(404, b"")
+        if name == "down.JS" or (name == "flaky.JS" and hits <= FLAKY_FAILURES):
+            return self.reply(503, b"")
+        body = FILES[name]
+        start = int(self.headers["Range"][6:].rstrip("-")) if self.headers.get("Range") else 0
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        if name == "truncated.JS" and hits == 1:
+            # Promise the whole file, send half of it and drop the connection
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_files_retries_with_backoff_and_reports_stats(server, tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fun_download.time, "sleep", sleeps.append)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    names = ["ok.JS", "flaky.JS", "truncated.JS", "down.JS", "gone.JS"]
+    jobs = [(f"{base_url}/{name}", str(tmp_path / name)) for name in names]
+
+    stats = download_files(jobs, max_workers=1, retries=3, backoff=0.5)
+
+    assert (stats["requested"], stats["downloaded"], stats["missing"], stats["failed"]) == (5, 3, 1, 1)
+    assert sorted(stats["paths"]) == sorted(str(tmp_path / name) for name in ["ok.JS", "flaky.JS", "truncated.JS"])
+    for name in ["ok.JS", "flaky.JS", "truncated.JS"]:
+        assert (tmp_path / name).read_bytes() == FILES[name]
+    assert not os.path.exists(tmp_path / "down.JS")
+
+    # The truncated transfer is resumed from the chunks already written, and only the rest counts as new bytes
+    truncated = [requested_range for name, requested_range in server.requests if name == "truncated.JS"]
+    assert len(truncated) == 2 and truncated[0] is None and truncated[1].startswith("bytes=")
+    offset = int(truncated[1][6:].rstrip("-"))
+    assert 0 < offset <= len(FILES["truncated.JS"]) // 2
+    assert stats["bytes"] == len(FILES["ok.JS"]) + len(FILES["flaky.JS"]) + len(FILES["truncated.JS"]) - offset
+    # Exponential backoff: 2 retries for flaky.JS, 1 for truncated.JS, 3 for down.JS (then it fails)
+    assert sorted(sleeps) == sorted([0.5, 1.0] + [0.5] + [0.5, 1.0, 2.0])
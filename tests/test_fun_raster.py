@@ -0,0 +1,13 @@
+import shapely
+
+from src.plot_maps.fun_raster import rasterize_labels
+
+
+def test_enclave_larger_than_its_surrounding_ring_stays_visible():
+    # The ring's own area (36) is smaller than the enclave's (64), but its shell (100) is larger
+    ring = shapely.box(0, 0, 10, 10).difference(shapely.box(1, 1, 9, 9))
+    enclave = shapely.box(1, 1, 9, 9)
+    for geometries, ring_label, enclave_label in [([ring, enclave], 1, 2), ([enclave, ring], 2, 1)]:
+        labels = rasterize_labels(geometries, (0, 0, 10, 10), 10, 10)
+        assert labels[5, 5] == enclave_label
+        assert labels[0, 0] == ring_label